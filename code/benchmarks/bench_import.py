@@ -0,0 +1,94 @@
+'''
+Benchmark of the time a fresh interpreter takes to import map_utils and
+render a PDDL problem, the startup cost of every short-lived worker.
+
+Run from the code directory:
+    python -m benchmarks.bench_import --budget 0.5
+
+With --budget the script exits with status 1 if the median time is above the
+budget, in seconds, or if one of the --forbidden modules was imported.
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Union
+
+
+STATEMENT = 'from map_utils import Map, carve_obstacles; Map.from_array(carve_obstacles(8, 8, 30)).to_pddl((0, 1))'
+FORBIDDEN = ['igraph', 'matplotlib']
+# The code directory, where map_utils is imported from.
+_CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the fresh interpreter: times the statement and lists the modules it imported.
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+exec({statement!r})
+elapsed = time.perf_counter() - start
+print(json.dumps({{"time": elapsed, "modules": sorted(sys.modules)}}))
+'''
+
+
+def measure_import(statement: str = STATEMENT, repeat: int = 5) -> Dict[str, Union[float, List[str]]]:
+    '''
+    Runs the statement in repeat fresh interpreters.
+
+    Args:
+        statement (str, optional): The code to time. Defaults to STATEMENT.
+        repeat (int, optional): The number of interpreters. Defaults to 5.
+
+    Returns:
+        Dict[str, Union[float, List[str]]]: The median time in seconds and the
+            top-level modules imported by the statement.
+    '''
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _SCRIPT.format(statement=statement)],
+                                cwd=_CODE_DIR, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.splitlines()[-1])
+        times.append(result['time'])
+    modules = sorted({name.split('.')[0] for name in result['modules']})
+    return {'time': statistics.median(times), 'modules': modules}
+
+
+def check_budget(result: Dict[str, Union[float, List[str]]], budget: float = None, forbidden: List[str] = FORBIDDEN) -> List[str]:
+    '''
+    Compares a result of measure_import with the budget.
+
+    Args:
+        result (Dict[str, Union[float, List[str]]]): The result of measure_import.
+        budget (float, optional): The maximum time in seconds. Defaults to None,
+                                  which only checks the modules.
+        forbidden (List[str], optional): The modules that must not be imported.
+                                         Defaults to FORBIDDEN.
+
+    Returns:
+        List[str]: A description of each violation.
+    '''
+    violations = [f'imported {name}' for name in forbidden if name in result['modules']]
+    if budget is not None and result['time'] > budget:
+        violations.append(f'time {1000 * result["time"]:.1f} ms > budget {1000 * budget:.1f} ms')
+    return violations
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the import time of map_utils.')
+    parser.add_argument('--statement', default=STATEMENT)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, help='Maximum median time in seconds.')
+    parser.add_argument('--forbidden', nargs='*', default=FORBIDDEN, help='Modules that must not be imported.')
+    args = parser.parse_args(argv)
+
+    result = measure_import(args.statement, args.repeat)
+    print(f'{1000 * result["time"]:.1f} ms, {len(result["modules"])} top-level modules')
+    violations = check_budget(result, args.budget, args.forbidden)
+    for violation in violations:
+        print(f'OVER BUDGET {violation}')
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
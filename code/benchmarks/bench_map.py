@@ -0,0 +1,155 @@
+'''
+Benchmarks of the generation stages of Map across grid sizes, obstacle
+percentages and jump percentages.
+
+Run from the code directory:
+    python -m benchmarks.bench_map --save benchmarks/baseline.json
+    python -m benchmarks.bench_map --baseline benchmarks/baseline.json
+
+With --baseline the script exits with status 1 if a stage got slower, or
+used more memory, than the baseline by more than --threshold.
+'''
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+from map_utils import Map
+
+
+SIZES = [8, 16, 32, 64, 128, 256, 512]
+OBSTACLES_PERCS = [10, 30, 50]
+JUMP_PERCS = [0, 25, 100]
+
+
+def stages(size: int, obstacles_perc: int, jump_perc: int) -> Dict[str, Tuple[Callable[[], object], Callable[[object], object]]]:
+    '''
+    Builds the stages to benchmark for a configuration. Each stage is a pair of
+    an untimed setup, returning the input of the stage, and the timed run.
+
+    Args:
+        size (int): The width and height of the map.
+        obstacles_perc (int): The percentage of obstacles.
+        jump_perc (int): The jump percentage of the random walk.
+
+    Returns:
+        Dict[str, Tuple[Callable[[], object], Callable[[object], object]]]: The
+            setup and run of each stage, by name.
+    '''
+    array = Map(size, size, obstacles_perc, jump_perc=jump_perc).array
+    fresh = lambda: Map(size, size, obstacles_perc, array.copy(), jump_perc=jump_perc)
+    pair = fresh().select_sources_targets(1)[0]
+    return {
+        'init': (lambda: None, lambda _: Map(size, size, obstacles_perc, jump_perc=jump_perc)),
+        'create_obstacles': (fresh, lambda map: map.create_obstacles()),
+        'from_array': (lambda: array.copy(), lambda a: Map.from_array(a)),
+        'to_pddl': (fresh, lambda map: map.to_pddl(pair)),
+        'select_sources_targets': (fresh, lambda map: map.select_sources_targets(20)),
+    }
+
+
+def measure(setup: Callable[[], object], run: Callable[[object], object], repeat: int) -> Dict[str, float]:
+    '''
+    Measures a stage: the best time over repeat runs, then the peak memory
+    allocated by one more run traced with tracemalloc.
+
+    Returns:
+        Dict[str, float]: The time in seconds and the peak memory in KiB.
+    '''
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    arg = setup()
+    tracemalloc.start()
+    run(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'time': min(times), 'peak_kib': peak / 1024}
+
+
+def run_benchmarks(sizes: List[int], obstacles_percs: List[int], jump_percs: List[int], repeat: int = 3,
+                   seed: int = 0, verbose: bool = True) -> Dict[str, Dict[str, Dict[str, float]]]:
+    '''
+    Runs every stage for every configuration.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, float]]]: The measures of each stage, by
+            configuration key and stage name.
+    '''
+    results = {}
+    for size in sizes:
+        for obstacles_perc in obstacles_percs:
+            for jump_perc in jump_percs:
+                np.random.seed(seed)
+                key = f'size={size},obstacles_perc={obstacles_perc},jump_perc={jump_perc}'
+                results[key] = {name: measure(setup, run, repeat)
+                                for name, (setup, run) in stages(size, obstacles_perc, jump_perc).items()}
+                if verbose:
+                    print(key)
+                    for name, m in results[key].items():
+                        print(f'    {name:<24}{1000 * m["time"]:>10.2f} ms{m["peak_kib"]:>12.1f} KiB')
+    return results
+
+
+def compare_results(results: dict, baseline: dict, threshold: float = 0.2, min_time: float = 0.001) -> List[str]:
+    '''
+    Compares results with a baseline.
+
+    Args:
+        results (dict): The results of run_benchmarks.
+        baseline (dict): The baseline results, with the same structure.
+        threshold (float, optional): The allowed relative increase. Defaults to 0.2.
+        min_time (float, optional): Stages faster than this, in seconds, in the
+                                    baseline are too noisy to compare on time.
+                                    Defaults to 0.001.
+
+    Returns:
+        List[str]: A description of each regression.
+    '''
+    regressions = []
+    for key, measures in results.items():
+        for name, m in measures.items():
+            base = baseline.get(key, {}).get(name)
+            if base is None:
+                continue
+            if base['time'] >= min_time and m['time'] > base['time'] * (1 + threshold):
+                regressions.append(f'{key} {name}: time {1000 * base["time"]:.2f} ms -> {1000 * m["time"]:.2f} ms')
+            if m['peak_kib'] > base['peak_kib'] * (1 + threshold) + 1:
+                regressions.append(f'{key} {name}: peak memory {base["peak_kib"]:.1f} KiB -> {m["peak_kib"]:.1f} KiB')
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the generation stages of Map.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--obstacles-percs', type=int, nargs='+', default=OBSTACLES_PERCS)
+    parser.add_argument('--jump-percs', type=int, nargs='+', default=JUMP_PERCS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare the results with this JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative regression.')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.obstacles_percs, args.jump_percs, args.repeat, args.seed)
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
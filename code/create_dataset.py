@@ -1,22 +1,593 @@
-from map_utils import Map
-import json
+from map_utils import Map, SCALAR_STATS, MapsWriter, DedupIndex, DatasetCheckpoint, iter_json_maps, format_map_id, parse_map_id, PDDLArchiveWriter, compress_problems
 import configparser
 from project_utils import set_working_dir, get_script_name, get_list_from_config
+from project_utils.metrics import Metrics, ProgressLogger
+import cProfile
+import json
+import operator
 import os
+import re
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from collections import deque
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Tuple, Union
 
-if __name__ == '__main__':
 
-    config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation())
+class BucketSpec:
+    """
+    The generation parameters of a (size, obstacle percentage) bucket, read from
+    the settings by read_bucket_specs.
+
+    Attributes:
+        row (int): The number of rows and columns of the maps.
+        obstacle_perc (int): The percentage of obstacles in the maps.
+        num_maps (int): The number of maps of the bucket.
+        num_paths (int): The number of source-target pairs per map. Default is 20.
+        jump_perc (int): The jump percentage of the random walk, see Map. Default is 25.
+        shuffle_edges (bool): Whether the walk visits the neighbours in random order.
+                              Default is True.
+        min_distance (int): The minimum path length of the pairs, see
+                            Map.select_sources_targets. Default is None.
+        stratify_pairs (bool): Whether to spread the pairs over the path lengths.
+                               Default is False.
+    """
+
+    def __init__(self, row: int, obstacle_perc: int, num_maps: int, num_paths: int = 20, jump_perc: int = 25,
+                 shuffle_edges: bool = True, min_distance: int = None, stratify_pairs: bool = False) -> None:
+        self.row = row
+        self.obstacle_perc = obstacle_perc
+        self.num_maps = num_maps
+        self.num_paths = num_paths
+        self.jump_perc = jump_perc
+        self.shuffle_edges = shuffle_edges
+        self.min_distance = min_distance
+        self.stratify_pairs = stratify_pairs
+
+
+    @property
+    def key(self) -> str:
+        """
+        The key of the bucket in file names and in the checkpoint, e.g. 8x8_30.
+        """
+        return f'{self.row}x{self.row}_{self.obstacle_perc}'
+
+
+    def create_map(self, entropy: int, index: int) -> Map:
+        """
+        Creates the index-th candidate map of the bucket, see Map.from_seed.
+
+        Args:
+            entropy (int): The root entropy of the dataset seed sequence.
+            index (int): The index of the candidate.
+
+        Returns:
+            Map: The map.
+        """
+        return Map.from_seed(entropy, self.row, self.row, self.obstacle_perc, index,
+                             jump_perc=self.jump_perc, shuffle_edges=self.shuffle_edges)
+
+
+    def select_pairs(self, map: Map) -> List[Tuple[int, int]]:
+        """
+        Selects the source-target pairs of a map of the bucket.
+
+        Args:
+            map (Map): The map.
+
+        Returns:
+            List[Tuple[int, int]]: The pairs.
+        """
+        return map.select_sources_targets(self.num_paths, min_distance=self.min_distance, stratify=self.stratify_pairs)
+
+
+    def to_dict(self) -> Dict:
+        """
+        Returns:
+            Dict: The parameters of the bucket.
+        """
+        return dict(vars(self))
+
+
+def read_bucket_specs(section: configparser.SectionProxy) -> List[BucketSpec]:
+    """
+    Reads the buckets of the settings: one for each of the comma separated rows
+    and obstacle_percs. Every parameter of BucketSpec but row and obstacle_perc
+    is read from the key with its name, and can be overridden for some buckets
+    with a suffix, from the most to the least specific:
+        num_paths.8x8_30 = 50 # For the 8x8 maps with 30% of obstacles
+        num_paths.8x8 = 30    # For all the 8x8 maps
+        num_paths.30% = 40    # For all the maps with 30% of obstacles
+
+    Args:
+        section (configparser.SectionProxy): The settings.
+
+    Returns:
+        List[BucketSpec]: The buckets, by row and then obstacle percentage.
+    """
+    getters = {'num_maps': section.getint, 'num_paths': section.getint, 'jump_perc': section.getint,
+               'shuffle_edges': section.getboolean, 'min_distance': section.getint, 'stratify_pairs': section.getboolean}
+    defaults = BucketSpec(0, 0, 0).to_dict()
+    specs = []
+    for row in get_list_from_config(section['rows'], int):
+        for obstacle_perc in get_list_from_config(section['obstacle_percs'], int):
+            params = {}
+            for name, get in getters.items():
+                for option in (f'{name}.{row}x{row}_{obstacle_perc}', f'{name}.{row}x{row}', f'{name}.{obstacle_perc}%', name):
+                    if option in section:
+                        params[name] = get(option) if section[option].strip() else None
+                        break
+                else:
+                    if name == 'num_maps':
+                        raise ValueError(f'num_maps is not set for the {row}x{row} {obstacle_perc}% bucket.')
+                    params[name] = defaults[name]
+            specs.append(BucketSpec(row, obstacle_perc, **params))
+    return specs
+
+
+STATS_OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+
+
+def parse_stats_filter(line: str) -> List[Tuple[str, str, float]]:
+    """
+    Parses a comma separated list of conditions on the statistics of Map.stats,
+    e.g. "dead_ends >= 2, density < 0.4".
+
+    Args:
+        line (str): The conditions. An empty line gives no condition.
+
+    Raises:
+        ValueError: If a condition cannot be parsed, or its statistic is not one
+                    of SCALAR_STATS.
+
+    Returns:
+        List[Tuple[str, str, float]]: The statistic, operator and value of each condition.
+    """
+    conditions = []
+    for condition in get_list_from_config(line) if line.strip() else []:
+        match = re.fullmatch(r'(\w+)\s*(<=|>=|==|!=|<|>)\s*(\S+)', condition)
+        if match is None:
+            raise ValueError(f'Invalid stats condition {condition}. Use e.g. dead_ends >= 2.')
+        if match[1] not in SCALAR_STATS:
+            raise ValueError(f'Unknown statistic {match[1]} in stats condition {condition}. Use one of {", ".join(SCALAR_STATS)}.')
+        conditions.append((match[1], match[2], float(match[3])))
+    return conditions
+
+
+def parse_stratify(stat: str, bins: str) -> Tuple[str, List[float]]:
+    """
+    Parses the statistic and the strata edges the maps of a bucket are spread over.
+
+    Args:
+        stat (str): A statistic of SCALAR_STATS, or an empty string for none.
+        bins (str): The comma separated edges of the strata, at least 2 and increasing.
+
+    Raises:
+        ValueError: If the statistic is unknown or the edges are invalid.
+
+    Returns:
+        Tuple[str, List[float]]: The statistic and the edges, or None if stat is empty.
+    """
+    stat = stat.strip()
+    if not stat:
+        return None
+    if stat not in SCALAR_STATS:
+        raise ValueError(f'Unknown stratify_stat {stat}. Use one of {", ".join(SCALAR_STATS)}.')
+    edges = get_list_from_config(bins, float) if bins.strip() else []
+    if len(edges) < 2 or any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError(f'stratify_bins must hold at least 2 increasing edges, got {bins}.')
+    return stat, edges
+
+
+def accept_stats(stats: Dict, conditions: List[Tuple[str, str, float]]) -> bool:
+    """
+    Checks the statistics of a map against conditions parsed by parse_stats_filter.
+
+    Args:
+        stats (Dict): The statistics of the map, see Map.stats.
+        conditions (List[Tuple[str, str, float]]): The conditions.
+
+    Returns:
+        bool: Whether every condition holds.
+    """
+    return all(STATS_OPERATORS[op](stats[name], value) for name, op, value in conditions)
+
+
+# The maximum number of candidates created by a single task.
+_CHUNK_SIZE = 64
+
+
+def generate_candidates(spec: BucketSpec, entropy: int, start: int, stop: int,
+                        stats_filter: List[Tuple[str, str, float]] = None,
+                        stat: str = None) -> Tuple[List[Tuple[int, np.ndarray, List[Tuple[int, int]], float]], Dict]:
+    """
+    Creates the candidate maps start to stop - 1 of a bucket and selects the
+    source-target pairs of the ones that satisfy stats_filter. Deduplication
+    and stratification depend on the candidates before, so they are left to
+    BucketGenerator.
+
+    Args:
+        spec (BucketSpec): The parameters of the bucket.
+        entropy (int): The root entropy of the dataset seed sequence.
+        start (int): The index of the first candidate.
+        stop (int): The index after the last candidate.
+        stats_filter (List[Tuple[str, str, float]], optional): The conditions a map must
+            satisfy, see parse_stats_filter. Defaults to None.
+        stat (str, optional): The statistic the maps are stratified on. Defaults to None.
+
+    Returns:
+        Tuple[List[Tuple[int, np.ndarray, List[Tuple[int, int]], float]], Dict]: The seed
+            index, the array, the source-target pairs and the value of stat of each
+            candidate, with None for array, pairs and value if it failed stats_filter,
+            and the metrics of the candidates.
+    """
+    metrics = Metrics()
+    candidates = []
+    for seed_index in range(start, stop):
+        with metrics.timer('map_generation'):
+            map = spec.create_map(entropy, seed_index)
+        value = None
+        if stats_filter or stat:
+            with metrics.timer('stats'):
+                stats = map.stats()
+            if not accept_stats(stats, stats_filter or []):
+                candidates.append((seed_index, None, None, None))
+                continue
+            value = stats[stat] if stat else None
+        with metrics.timer('pair_selection'):
+            candidates.append((seed_index, map.array, spec.select_pairs(map), value))
+    return candidates, metrics.to_dict()
+
+
+class BucketGenerator:
+    """
+    Generates the distinct maps of a (size, obstacle percentage) bucket and
+    selects the source-target pairs of each map. Every candidate map draws from
+    its own stream, seeded by map_seed from entropy, the bucket and the index
+    of the candidate, so a map does not depend on the process that creates it
+    and can be regenerated from its index with regenerate_map. Candidates can be
+    filtered and stratified on their statistics, see Map.stats.
+
+    The candidates are created in chunks by generate_candidates, in the workers
+    of pool if one is given, and resolved in seed order by generate: duplicates,
+    strata and rejects are decided as in a serial run, so the maps do not depend
+    on the number of workers.
+
+    Attributes:
+        spec (BucketSpec): The parameters of the bucket.
+        entropy (int): The root entropy of the dataset seed sequence.
+        index (DedupIndex): The maps of the bucket, new maps included. Maps in it
+            are rejected as duplicates. Default is an empty index.
+        max_rejects (int): The number of consecutive rejected candidates after which
+            the bucket is considered exhausted. Default is 1000.
+        stats_filter (List[Tuple[str, str, float]]): The conditions a map must satisfy,
+            see parse_stats_filter. Default is None.
+        stratify (Tuple[str, List[float], int]): A statistic, the edges of its strata
+            and the maximum number of maps per stratum. Maps outside the edges, or in
+            a full stratum, are rejected. Default is None.
+        strata (List[int]): The number of maps in each stratum, None without stratify.
+        pool (Pool): The pool creating the candidates. Default is None, which creates
+            them in the calling process.
+        num_workers (int): The number of workers of pool. Default is 1.
+        next_seed (int): The index of the next candidate. Default is 0.
+        exhausted (bool): Whether the bucket ran out of new maps.
+        metrics (Metrics): The metrics of the bucket.
+    """
+
+    def __init__(self, spec: BucketSpec, entropy: int, index: DedupIndex = None, max_rejects: int = 1000, start: int = 0,
+                 stats_filter: List[Tuple[str, str, float]] = None, stratify: Tuple[str, List[float], int] = None,
+                 strata: List[int] = None, pool: Pool = None, num_workers: int = 1, log_interval: float = 30.0) -> None:
+        self.spec = spec
+        self.entropy = entropy
+        self.index = index if index is not None else DedupIndex()
+        self.max_rejects = max_rejects
+        self.stats_filter = stats_filter
+        self.stratify = stratify
+        self.strata = None
+        if stratify is not None:
+            self.strata = list(strata) if strata is not None else [0] * (len(stratify[1]) - 1)
+        self.pool = pool
+        self.num_workers = num_workers
+        self.next_seed = start
+        self.exhausted = False
+        self.metrics = Metrics()
+        self._rejects = 0
+        self._progress = ProgressLogger(log_interval)
+
+
+    def generate(self, num_maps: int) -> Iterator[Tuple[int, np.ndarray, List[Tuple[int, int]]]]:
+        """
+        Yields new maps of the bucket, continuing from next_seed.
+
+        Args:
+            num_maps (int): The number of maps to generate.
+
+        Yields:
+            Tuple[int, np.ndarray, List[Tuple[int, int]]]: The seed index, the array
+                and the source-target pairs of each map, in seed order. There are
+                fewer than num_maps if the bucket is exhausted.
+        """
+        maps = 0
+        start = self.next_seed
+        pending = deque()
+        stat = self.stratify[0] if self.stratify is not None else None
+        self.exhausted = self.exhausted or self._rejects >= self.max_rejects
+        while maps < num_maps and not self.exhausted:
+            # Chunks are sized on the maps still missing, so few candidates past
+            # the last map are created, and every worker gets some.
+            while len(pending) < (2 * self.num_workers if self.pool is not None else 1):
+                missing = num_maps - maps - sum(size for size, _ in pending)
+                size = min(max(-(-missing // self.num_workers), 1), _CHUNK_SIZE)
+                args = (self.spec, self.entropy, start, start + size, self.stats_filter, stat)
+                pending.append((size, self.pool.apply_async(generate_candidates, args) if self.pool is not None else args))
+                start += size
+            _, task = pending.popleft()
+            candidates, metrics = task.get() if self.pool is not None else generate_candidates(*task)
+            self.metrics.merge(metrics)
+            for seed_index, array, pairs, value in candidates:
+                self.next_seed = seed_index + 1
+                self.metrics.count('maps_generated')
+                stratum = None
+                if array is not None and self.stratify is not None:
+                    _, edges, quota = self.stratify
+                    stratum = int(np.searchsorted(edges, value, side='right')) - 1
+                    if not 0 <= stratum < len(self.strata) or self.strata[stratum] >= quota:
+                        array = None
+                if array is None:
+                    self._rejects += 1
+                    self.metrics.count('stats_rejects')
+                else:
+                    with self.metrics.timer('dedup'):
+                        added = self.index.add(array)
+                    if added:
+                        self._rejects = 0
+                        if stratum is not None:
+                            self.strata[stratum] += 1
+                        maps += 1
+                        yield seed_index, array, pairs
+                    else:
+                        self._rejects += 1
+                        self.metrics.count('dedup_rejects')
+                self._progress.log(f'Bucket {self.spec.row}x{self.spec.row} {self.spec.obstacle_perc}%', maps=maps, rejects=self.index.rejects)
+                # A map without obstacles has a single variant.
+                if maps < num_maps and (self._rejects >= self.max_rejects or self.spec.obstacle_perc == 0):
+                    self.exhausted = True
+                if maps >= num_maps or self.exhausted:
+                    break
+
+
+def regenerate_map(map_id: str, entropy: int, spec: BucketSpec) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """
+    Regenerates a map of a dataset, and its source-target pairs, from its id.
+
+    Args:
+        map_id (str): The id of the map, see format_map_id.
+        entropy (int): The root entropy of the dataset, saved in its checkpoint.
+        spec (BucketSpec): The parameters of the bucket of the map, saved in the
+            run summary.
+
+    Returns:
+        Tuple[np.ndarray, List[Tuple[int, int]]]: The array and the source-target
+            pairs of the map.
+    """
+    _, _, _, index = parse_map_id(map_id)
+    map = spec.create_map(entropy, index)
+    return map.array, spec.select_pairs(map)
+
+
+def write_problems(array: np.ndarray, obstacle_perc: int, problems: List[Tuple[str, int, int]], target_problems_dir: str, annotate: bool = False) -> Dict:
+    """
+    Writes the PDDL files of the problems of a map.
+
+    Args:
+        array (np.ndarray): The array of the map.
+        obstacle_perc (int): The percentage of obstacles of the map.
+        problems (List[Tuple[str, int, int]]): Name, source and target of each problem.
+        target_problems_dir (str): The directory where the PDDL files are saved.
+        annotate (bool, optional): Whether to add the optimal plan length as a comment
+            to each problem. Defaults to False.
+
+    Returns:
+        Dict: The metrics of the writes.
+    """
+    metrics = Metrics()
+    with metrics.timer('pddl_write'):
+        map = Map(array.shape[1], array.shape[0], obstacle_perc, array)
+        for fname, source, target in problems:
+            with open(os.path.join(target_problems_dir, f'{fname}.pddl'), 'w') as f:
+                map.write_pddl(f, (source, target), annotate)
+                f.close()
+    metrics.count('pddl_files', len(problems))
+    return metrics.to_dict()
+
+
+def render_problems(array: np.ndarray, obstacle_perc: int, problems: List[Tuple[str, int, int]], annotate: bool = False,
+                    format: str = 'zip', compresslevel: int = 6) -> Tuple[Tuple[List[Tuple[str, int, int, int, int]], bytes, int], Dict]:
+    """
+    Renders and compresses the PDDL of the problems of a map, to be appended to
+    an archive by the main process, see compress_problems.
+
+    Args:
+        array (np.ndarray): The array of the map.
+        obstacle_perc (int): The percentage of obstacles of the map.
+        problems (List[Tuple[str, int, int]]): Name, source and target of each problem.
+        annotate (bool, optional): Whether to add the optimal plan length as a comment
+            to each problem. Defaults to False.
+        format (str, optional): The format of the archive, zip or tar.gz. Defaults to zip.
+        compresslevel (int, optional): The zlib compression level. Defaults to 6.
+
+    Returns:
+        Tuple[Tuple[List[Tuple[str, int, int, int, int]], bytes, int], Dict]: The block
+            of the problems, for PDDLArchiveWriter.add_compressed, and the metrics of
+            the rendering and compression.
+    """
+    metrics = Metrics()
+    with metrics.timer('pddl_render'):
+        map = Map(array.shape[1], array.shape[0], obstacle_perc, array)
+        texts = [(fname, map.to_pddl((source, target), annotate)) for fname, source, target in problems]
+    with metrics.timer('pddl_compress'):
+        block = compress_problems(texts, format, compresslevel)
+    return block, metrics.to_dict()
+
+
+def estimate_bucket(spec: BucketSpec, num_maps: int, entropy: int, sample_maps: int, compact_maps: bool = False,
+                    pddl_format: str = 'files', pddl_shard_size: int = 10000, annotate: bool = False,
+                    max_rejects: int = 1000, stats_filter: List[Tuple[str, str, float]] = None,
+                    stratify: Tuple[str, List[float], int] = None, compresslevel: int = 6) -> Dict:
+    """
+    Estimates the cost of generating the maps of a bucket by generating and
+    writing a sample of them in a temporary directory, with the same writers as
+    the real run. Disk usage is measured on the allocated blocks, so the block
+    rounding of many small PDDL files is included.
+
+    Args:
+        spec (BucketSpec): The parameters of the bucket.
+        num_maps (int): The number of maps left to generate.
+        entropy (int): The root entropy of the dataset seed sequence.
+        sample_maps (int): The number of maps of the sample.
+        compact_maps (bool, optional): Whether the JSON file uses the compact layout.
+            Defaults to False.
+        pddl_format (str, optional): files, zip or tar.gz. Defaults to files.
+        pddl_shard_size (int, optional): The number of problems per archive shard.
+            Defaults to 10000.
+        annotate (bool, optional): Whether the problems are annotated. Defaults to False.
+        max_rejects (int, optional): See BucketGenerator. Defaults to 1000.
+        stats_filter (List[Tuple[str, str, float]], optional): See BucketGenerator.
+            Defaults to None.
+        stratify (Tuple[str, List[float], int], optional): See BucketGenerator.
+            Defaults to None.
+        compresslevel (int, optional): The compression level of the archives. Defaults to 6.
+
+    Returns:
+        Dict: The estimated number of maps, problems, seconds, bytes of JSON and
+            PDDL, and files (JSON file and dedup index included) of the bucket,
+            with the sampled throughput. serial_seconds is the part of seconds
+            spent in the main process, which does not scale with the workers. If the sample stopped short, because the
+            bucket ran out of new maps, the bucket is estimated to stop there too.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        generator = BucketGenerator(spec, entropy, max_rejects=max_rejects, stats_filter=stats_filter,
+                                    stratify=stratify, log_interval=float('inf'))
+        maps = list(generator.generate(min(sample_maps, num_maps)))
+        # The main process resolves the candidates and writes the JSON file and
+        # the archives, the rest is shared by the workers.
+        metrics = generator.metrics
+        index = 0
+        pddl_dir = os.path.join(tmp, 'pddl')
+        os.makedirs(pddl_dir)
+        archive = PDDLArchiveWriter(pddl_dir, 'problems', pddl_shard_size, pddl_format) if pddl_format != 'files' else None
+        with MapsWriter(os.path.join(tmp, 'maps.json'), compact=compact_maps) as writer:
+            for seed_index, array, tuples in maps:
+                problems = [(f'p{index + i :06d}', source, target) for i, (source, target) in enumerate(tuples)]
+                index += len(problems)
+                with metrics.timer('json_write'):
+                    writer.write_map(format_map_id(spec.row, spec.row, spec.obstacle_perc, seed_index), array, problems)
+                if archive is None:
+                    write_problems(array, spec.obstacle_perc, problems, pddl_dir, annotate)
+                else:
+                    block, _ = render_problems(array, spec.obstacle_perc, problems, annotate, pddl_format, compresslevel)
+                    with metrics.timer('pddl_write'):
+                        archive.add_compressed(*block)
+            with metrics.timer('json_write'):
+                writer.flush()
+        if archive is not None:
+            with metrics.timer('pddl_write'):
+                archive.close()
+        seconds = time.perf_counter() - start
+        json_bytes = os.stat(os.path.join(tmp, 'maps.json')).st_blocks * 512
+        pddl_bytes = sum(os.stat(os.path.join(pddl_dir, f)).st_blocks * 512 for f in os.listdir(pddl_dir))
+    exhausted = len(maps) < min(sample_maps, num_maps)
+    total_maps = len(maps) if exhausted else num_maps
+    scale = total_maps / max(len(maps), 1)
+    problems = int(round(index * scale))
+    if pddl_format == 'files':
+        files = problems
+    else:
+        files = int(np.ceil(problems / pddl_shard_size)) + 1 if problems > 0 else 0
+    return {
+        'key': spec.key,
+        'sampled_maps': len(maps),
+        'maps_per_second': len(maps) / seconds if seconds > 0 else 0.0,
+        'exhausted': exhausted,
+        'maps': total_maps,
+        'problems': problems,
+        'seconds': seconds * scale,
+        'serial_seconds': sum(metrics.timers[name] for name in ('dedup', 'json_write', 'pddl_write')) * scale,
+        'json_bytes': int(json_bytes * scale),
+        'pddl_bytes': int(pddl_bytes * scale),
+        'files': files + 2,
+    }
+
+
+def write_summary(path: str, metrics: Metrics, elapsed: float, settings: Dict, extra: Dict = None) -> None:
+    """
+    Writes the summary of a run as JSON.
+
+    Args:
+        path (str): The path of the summary file.
+        metrics (Metrics): The metrics of the run.
+        elapsed (float): The duration of the run in seconds.
+        settings (Dict): The settings of the run.
+        extra (Dict, optional): Additional entries. Defaults to None.
+    """
+    counters = metrics.counters
+    summary = {
+        'settings': settings,
+        'elapsed': elapsed,
+        'maps_per_second': counters['maps'] / elapsed if elapsed > 0 else 0.0,
+        'problems_per_second': counters['problems'] / elapsed if elapsed > 0 else 0.0,
+        'reject_rate': counters['dedup_rejects'] / counters['maps_generated'] if counters['maps_generated'] > 0 else 0.0,
+        **metrics.to_dict(),
+        **(extra or {}),
+    }
+    with open(path, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def read_config(path: Union[str, os.PathLike]) -> configparser.ConfigParser:
+    '''
+    Reads the .ini file of the script. Text after a # is a comment, also at the
+    end of a line, so a key followed only by a comment, such as
+    min_distance = # ..., is empty.
+
+    Args:
+        path (Union[str, os.PathLike]): The path of the .ini file.
+
+    Returns:
+        configparser.ConfigParser: The configuration.
+    '''
+    config = configparser.ConfigParser(interpolation=configparser.ExtendedInterpolation(), inline_comment_prefixes=('#',))
+    config.read(path)
+    return config
+
+
+def read_seed(section: configparser.SectionProxy) -> int:
+    """
+    Reads the seed of the dataset from the settings.
+
+    Args:
+        section (configparser.SectionProxy): The settings.
+
+    Returns:
+        int: The seed, or None if it is missing or empty, for a random one.
+    """
+    return None if not section.get('seed', '').strip() else section.getint('seed')
+
+
+def main() -> None:
     set_working_dir()
 
-    config.read(f'{get_script_name()}.ini')
+    config = read_config(f'{get_script_name()}.ini')
     if config['DEFAULT'].getboolean('run_debug_mode'):
         main_tag = 'DEBUG_SETTINGS'
         exp_tag = 'DEBUG_SETTINGS'
     else:
         main_tag = 'DEFAULT'
         exp_tag = 'EXPERIMENTAL_SETTINGS'
-    
+
 
     target_maps_dir = config[main_tag]['maps_dir']
     target_problems_dir = config[main_tag]['pddl_dir']
@@ -26,37 +597,212 @@ if __name__ == '__main__':
     if not os.path.exists(target_problems_dir):
         os.makedirs(target_problems_dir)
 
-    rows = get_list_from_config(config[exp_tag]['rows'], int)
-    obstacle_percs = get_list_from_config(config[exp_tag]['obstacle_percs'], int)
-    num_maps = int(config[exp_tag]['num_maps'])
-    
-    index = 0
-
-    for row in rows:
-        for obstacle_perc in obstacle_percs:
-            json_file = os.path.join(target_maps_dir, f'maps_{row}x{row}_{obstacle_perc}.json')
-            maps_set = set()
-            count = 0
-            while len(maps_set) < num_maps and count < 1000:
-                map = Map(row, row, obstacle_perc)
-                if tuple(map.array.flatten()) not in maps_set:
-                    maps_set.add(tuple(map.array.flatten()))
-                    count = 0
-                    tuples = map.select_sources_targets(20)
-                    for source, target in tuples:
-                        fname = f'p{index :06d}'
-                        with open(json_file, 'a') as f:
-                            json.dump({'problem' : fname, 'map': map.array.tolist(), 'source_destination' : (source, target)}, f)
-                            f.write('\n')
-                            f.close()
-                        with open(os.path.join(target_problems_dir, f'{fname}.pddl'), 'w') as f:
-                            f.write(map.to_pddl((source, target)))
-                            f.close()
-                        index += 1
+    specs = read_bucket_specs(config[exp_tag])
+    num_workers = config[main_tag].getint('num_workers', fallback=1)
+    compact_maps = config[main_tag].getboolean('compact_maps', fallback=False)
+    annotate_pddl = config[main_tag].getboolean('annotate_pddl', fallback=False)
+    log_interval = config[main_tag].getfloat('log_interval', fallback=30.0)
+    checkpoint_maps = config[main_tag].getint('checkpoint_maps', fallback=1000)
+    profile = config[main_tag].get('profile', fallback='none')
+    preview_maps = config[main_tag].getint('preview_maps', fallback=0)
+    pddl_format = config[main_tag].get('pddl_format', fallback='files')
+    pddl_shard_size = config[main_tag].getint('pddl_shard_size', fallback=10000)
+    pddl_compress_level = config[main_tag].getint('pddl_compress_level', fallback=6)
+    dry_run = config[main_tag].getboolean('dry_run', fallback=False)
+    dry_run_maps = config[main_tag].getint('dry_run_maps', fallback=5)
+    symmetric_dedup = config[exp_tag].getboolean('symmetric_dedup', fallback=False)
+    max_rejects = config[exp_tag].getint('max_rejects', fallback=1000)
+    seed = read_seed(config[exp_tag])
+    stats_filter = parse_stats_filter(config[exp_tag].get('stats_filter', fallback=''))
+    stratify_stat, stratify_bins = parse_stratify(config[exp_tag].get('stratify_stat', fallback=''),
+                                                  config[exp_tag].get('stratify_bins', fallback='')) or ('', None)
+
+    checkpoint_path = os.path.join(target_maps_dir, 'checkpoint.json')
+    resume = os.path.exists(checkpoint_path)
+    if resume:
+        checkpoint = DatasetCheckpoint.load(checkpoint_path)
+        if seed is not None and seed != checkpoint.entropy:
+            raise ValueError(f'The dataset in {target_maps_dir} was generated with seed {checkpoint.entropy}, not {seed}.')
+    else:
+        checkpoint = DatasetCheckpoint(checkpoint_path, np.random.SeedSequence(seed).entropy)
+    entropy = checkpoint.entropy
+
+    if profile not in ('none', 'cprofile', 'tracemalloc'):
+        raise ValueError(f'Unknown profile mode {profile}. Use none, cprofile or tracemalloc.')
+    if pddl_format not in ('files', 'zip', 'tar.gz'):
+        raise ValueError(f'Unknown PDDL format {pddl_format}. Use files, zip or tar.gz.')
+
+    def stratify(spec: BucketSpec) -> Tuple[str, List[float], int]:
+        if not stratify_stat:
+            return None
+        return stratify_stat, stratify_bins, int(np.ceil(spec.num_maps / (len(stratify_bins) - 1)))
+
+    # Buckets still missing maps.
+    buckets = [(spec, checkpoint.bucket(spec.key)) for spec in specs]
+    buckets = [(spec, state) for spec, state in buckets if state['maps'] < spec.num_maps and not state['exhausted']]
+
+    if dry_run:
+        estimates = []
+        for spec, state in buckets:
+            estimate = estimate_bucket(spec, spec.num_maps - state['maps'], entropy, dry_run_maps, compact_maps,
+                                       pddl_format, pddl_shard_size, annotate_pddl, max_rejects, stats_filter, stratify(spec),
+                                       pddl_compress_level)
+            estimates.append(estimate)
+            seconds = estimate['serial_seconds'] + (estimate['seconds'] - estimate['serial_seconds']) / num_workers
+            print(f'Bucket {spec.row}x{spec.row} {spec.obstacle_perc}%: {estimate["maps"]} maps, {estimate["problems"]} problems, '
+                  f'{seconds:.1f} s, {(estimate["json_bytes"] + estimate["pddl_bytes"]) / 2**20:.1f} MiB, '
+                  f'{estimate["files"]} files ({estimate["maps_per_second"]:.1f} maps/s on {estimate["sampled_maps"]} sampled maps'
+                  f'{", bucket exhausted" if estimate["exhausted"] else ""})')
+        # The workers share the candidates and the problems of every bucket, the
+        # main process writes the files alone.
+        serial = sum(e['serial_seconds'] for e in estimates)
+        seconds = serial + (sum(e['seconds'] for e in estimates) - serial) / num_workers
+        total = {'seconds': seconds, 'bytes': sum(e['json_bytes'] + e['pddl_bytes'] for e in estimates),
+                 'files': sum(e['files'] for e in estimates), 'maps': sum(e['maps'] for e in estimates),
+                 'problems': sum(e['problems'] for e in estimates)}
+        print(f'Estimated total: {total["maps"]} maps, {total["problems"]} problems, {total["seconds"]:.1f} s with '
+              f'{num_workers} workers, {total["bytes"] / 2**20:.1f} MiB, {total["files"]} files.')
+        with open(os.path.join(target_maps_dir, 'dry_run.json'), 'w') as f:
+            json.dump({'buckets': estimates, 'total': total}, f, indent=2)
+        return
+
+    if profile == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'tracemalloc':
+        tracemalloc.start()
+    metrics = Metrics()
+    progress = ProgressLogger(log_interval)
+
+    # When resuming, whatever a killed run wrote after the last commit of a bucket
+    # is cut from the JSON files and the PDDL archive indices, and the dedup index
+    # is rebuilt from the JSON files if it does not match the checkpoint.
+    if resume:
+        for spec in specs:
+            key = spec.key
+            state = checkpoint.bucket(key)
+            json_file = os.path.join(target_maps_dir, f'maps_{key}.json')
+            index_path = os.path.join(target_maps_dir, f'maps_{key}.dedup.npz')
+            if os.path.exists(json_file) and os.path.getsize(json_file) > state['json_size']:
+                with open(json_file, 'r+') as f:
+                    f.truncate(state['json_size'])
+            archive_index = os.path.join(target_problems_dir, f'problems_{key}.index.jsonl')
+            if os.path.exists(archive_index) and os.path.getsize(archive_index) > state.get('pddl_index_size', 0):
+                with open(archive_index, 'r+') as f:
+                    f.truncate(state.get('pddl_index_size', 0))
+            if os.path.exists(index_path) and len(DedupIndex(symmetric_dedup, index_path)) != state['maps']:
+                dedup_index = DedupIndex(symmetric_dedup)
+                for grid, _ in iter_json_maps(json_file) if os.path.exists(json_file) else []:
+                    dedup_index.add(grid)
+                dedup_index.save(index_path)
+
+    pool = Pool(num_workers) if num_workers > 1 else None
+    index = checkpoint.next_index
+
+    # Buckets run one at a time: the workers share the candidates and the PDDL
+    # problems of the current bucket.
+    for spec, state in buckets:
+        row, obstacle_perc, key = spec.row, spec.obstacle_perc, spec.key
+        dedup_index = DedupIndex(symmetric_dedup, os.path.join(target_maps_dir, f'maps_{key}.dedup.npz'))
+        generator = BucketGenerator(spec, entropy, dedup_index, max_rejects, state['next_seed'], stats_filter,
+                                    stratify(spec), state.get('strata'), pool, num_workers, log_interval)
+        json_file = os.path.join(target_maps_dir, f'maps_{key}.json')
+        archive = None
+        if pddl_format != 'files':
+            archive = PDDLArchiveWriter(target_problems_dir, f'problems_{key}', pddl_shard_size, pddl_format,
+                                        state.get('pddl_shards', 0))
+
+        def collect(result: Union[Dict, Tuple[Tuple[List[Tuple[str, int, int, int, int]], bytes, int], Dict]]) -> None:
+            if archive is None:
+                metrics.merge(result)
+                return
+            block, render_metrics = result
+            metrics.merge(render_metrics)
+            with metrics.timer('pddl_write'):
+                archive.add_compressed(*block)
+            metrics.count('pddl_files', len(block[0]))
+
+        def commit(maps: int, exhausted: bool) -> None:
+            # Everything up to the last map reaches the disk before the checkpoint
+            # points past it. The current archive shard is closed, so its index
+            # lines are written, and the next map starts a new one.
+            writer.flush()
+            while pending:
+                collect(pending.pop(0).get())
+            bucket_state = {} if generator.strata is None else {'strata': generator.strata}
+            if archive is not None:
+                archive.close()
+                bucket_state.update(pddl_shards=archive.shards,
+                                    pddl_index_size=os.path.getsize(archive.index_path) if os.path.exists(archive.index_path) else 0)
+            dedup_index.save()
+            checkpoint.commit(key, state['maps'] + maps, os.path.getsize(json_file), generator.next_seed,
+                              exhausted, index, **bucket_state)
+
+        # Results are collected in map order, so the archives are deterministic:
+        # the writer stamps every member with a fixed time.
+        pending = []
+        preview = []
+        maps = 0
+        with MapsWriter(json_file, compact=compact_maps) as writer:
+            for seed_index, array, tuples in generator.generate(spec.num_maps - state['maps']):
+                problems = []
+                for source, target in tuples:
+                    problems.append((f'p{index :06d}', source, target))
+                    index += 1
+                with metrics.timer('json_write'):
+                    writer.write_map(format_map_id(row, row, obstacle_perc, seed_index), array, problems)
+                metrics.count('maps')
+                metrics.count('problems', len(problems))
+                if archive is not None:
+                    task, args = render_problems, (array, obstacle_perc, problems, annotate_pddl, pddl_format, pddl_compress_level)
                 else:
-                    count += 1
-                if obstacle_perc == 0:
-                    break
-            
-                
-                
\ No newline at end of file
+                    task, args = write_problems, (array, obstacle_perc, problems, target_problems_dir, annotate_pddl)
+                if pool is not None:
+                    pending.append(pool.apply_async(task, args))
+                    while pending and pending[0].ready():
+                        collect(pending.pop(0).get())
+                else:
+                    collect(task(*args))
+                if len(preview) < preview_maps:
+                    preview.append((array, tuples[0] if tuples else None))
+                maps += 1
+                if checkpoint_maps > 0 and maps % checkpoint_maps == 0:
+                    commit(maps, False)
+                progress.log('Dataset', maps=metrics.counters['maps'], problems=metrics.counters['problems'])
+            commit(maps, generator.exhausted)
+
+        bucket_metrics = generator.metrics.to_dict()
+        metrics.merge(bucket_metrics)
+        counters = bucket_metrics['counters']
+        reject_rate = counters.get('dedup_rejects', 0) / max(counters.get('maps_generated', 0), 1)
+        stats_rate = counters.get('stats_rejects', 0) / max(counters.get('maps_generated', 0), 1)
+        print(f'Bucket {row}x{row} {obstacle_perc}%: {maps} maps, {100 * reject_rate:.1f}% of the generated maps rejected as duplicates'
+              + (f', {100 * stats_rate:.1f}% by their stats.' if stats_filter or stratify_stat else '.'))
+        if preview:
+            with metrics.timer('preview'):
+                from map_utils.plot_utils import save_tiles
+                save_tiles(np.stack([array for array, _ in preview]), os.path.join(target_maps_dir, f'maps_{key}.png'),
+                           [pair for _, pair in preview])
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    progress.log('Dataset', force=True, maps=metrics.counters['maps'], problems=metrics.counters['problems'])
+
+    extra = {}
+    if profile == 'cprofile':
+        profiler.disable()
+        extra['profile'] = os.path.join(target_maps_dir, 'run_profile.prof')
+        profiler.dump_stats(extra['profile'])
+    elif profile == 'tracemalloc':
+        extra['tracemalloc_peak_kib'] = tracemalloc.get_traced_memory()[1] / 1024
+        extra['tracemalloc_top'] = [str(stat) for stat in tracemalloc.take_snapshot().statistics('lineno')[:20]]
+        tracemalloc.stop()
+    settings = {'buckets': [spec.to_dict() for spec in specs], 'num_workers': num_workers,
+                'seed': seed, 'entropy': entropy, 'symmetric_dedup': symmetric_dedup, 'max_rejects': max_rejects,
+                'stats_filter': stats_filter, 'stratify_stat': stratify_stat, 'stratify_bins': stratify_bins}
+    write_summary(os.path.join(target_maps_dir, 'run_summary.json'), metrics, progress.elapsed(), settings, extra)
+
+
+if __name__ == '__main__':
+    main()
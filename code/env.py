@@ -37,4 +37,59 @@ class navigation_env():
     #             if self.cur_pos == self.goal_pos:
     #                 done = True
     #                 break
-    #     return done
\ No newline at end of file
+    #     return done
+
+# Moves of the actions: 0 up, 1 down, 2 left, 3 right
+action_moves = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]])
+
+
+class batch_navigation_env():
+    '''
+    Many navigation environments stepped together. The layouts are stacked in a
+    (B, N, N) block tensor and all the agents move at once from an action vector.
+
+    Attributes:
+        grid_size (int): The size of the layouts.
+        blocks (np.array): (B, N, N) array, 1 where a cell is blocked.
+        start_pos (np.array): (B, 2) array with the start (row, col) of each agent.
+        goal_pos (np.array): (B, 2) array with the goal (row, col) of each agent.
+        cur_pos (np.array): (B, 2) array with the current (row, col) of each agent.
+        done (np.array): (B,) boolean array, True once an agent reached its goal.
+    '''
+    def __init__(self, grid_size):
+        self.grid_size = grid_size
+
+    # Load a batch of layouts, each a sequence as in navigation_env.load_layout
+    def load_layouts(self, seqs):
+        blocks, start_pos, goal_pos = zip(*seqs)
+        self.load_arrays(np.array(blocks), np.array(start_pos), np.array(goal_pos))
+
+    # Load a batch of layouts already stacked as arrays
+    def load_arrays(self, blocks, start_pos, goal_pos):
+        self.blocks = np.asarray(blocks, dtype=int)
+        self.start_pos = np.asarray(start_pos, dtype=int).reshape(-1, 2)
+        self.goal_pos = np.asarray(goal_pos, dtype=int).reshape(-1, 2)
+        self.grid_size = self.blocks.shape[1]
+        self.cur_pos = self.start_pos.copy()
+        self.done = np.zeros(len(self.blocks), dtype=bool)
+        self.reset_game()
+
+    # Reset the agents to their starting positions, all of them or those in mask
+    def reset_game(self, mask=None):
+        if mask is None:
+            mask = np.ones(len(self.blocks), dtype=bool)
+        self.cur_pos[mask] = self.start_pos[mask]
+        self.done[mask] = np.all(self.start_pos[mask] == self.goal_pos[mask], axis=1)
+
+    # Move every agent that is not done by one action. Moves into walls or out of
+    # the grid leave the agent in place. Returns the done mask and the mask of the
+    # agents whose action was valid.
+    def step(self, actions):
+        target = self.cur_pos + action_moves[np.asarray(actions)]
+        inside = np.all((target >= 0) & (target < self.grid_size), axis=1)
+        rows, cols = np.clip(target, 0, self.grid_size - 1).T
+        valid = inside & (self.blocks[np.arange(len(self.blocks)), rows, cols] == 0)
+        moved = valid & ~self.done
+        self.cur_pos[moved] = target[moved]
+        self.done |= np.all(self.cur_pos == self.goal_pos, axis=1)
+        return self.done.copy(), valid
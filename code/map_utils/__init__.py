@@ -1,2 +1,24 @@
 from map_utils.map import *
-from map_utils.plot_utils import *
\ No newline at end of file
+from map_utils.dataset import *
+from map_utils.mapset import *
+from map_utils.dedup import *
+from map_utils.pddl_archive import *
+from map_utils import map, dataset, mapset, dedup, pddl_archive
+
+# The plotting functions are imported from plot_utils on first access, so that
+# importing map_utils does not import matplotlib.
+_PLOT_UTILS = ('plot_maps', 'plot_map', 'map_codes', 'tile_maps', 'plot_tiles', 'save_tiles', 'save_thumbnails')
+# A star import exports the public names of the submodules and, resolving them
+# through __getattr__, the plotting functions.
+__all__ = map.__all__ + dataset.__all__ + mapset.__all__ + dedup.__all__ + pddl_archive.__all__ + list(_PLOT_UTILS)
+
+
+def __getattr__(name: str):
+    if name in _PLOT_UTILS:
+        from map_utils import plot_utils
+        return getattr(plot_utils, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_PLOT_UTILS))
\ No newline at end of file
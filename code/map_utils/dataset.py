@@ -0,0 +1,338 @@
+import json
+import os
+import queue
+import threading
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+__all__ = ['MapsWriter', 'DatasetCheckpoint', 'format_map_id', 'parse_map_id', 'iter_problems',
+           'layout_batches']
+
+
+class MapsWriter:
+    '''
+    A buffered writer for the maps JSONL file of a bucket. The file is kept
+    open for the whole bucket, the grid of each map is serialized once and the
+    records are written in batches.
+
+    In the default layout every line is a problem:
+        {"problem": "p000000", "map": [[0, 1], ...], "source_destination": [0, 5]}
+    In the compact layout every map is written once and followed by its problems,
+    which reference it by id:
+        {"map_id": "m000000", "map": [[0, 1], ...]}
+        {"problem": "p000000", "map_id": "m000000", "source_destination": [0, 5]}
+
+    Attributes:
+        path (Union[str, os.PathLike]): The path of the JSONL file. Records are
+                                        appended to it.
+        compact (bool): Whether to use the compact layout. Default is False.
+        buffer_size (int): The number of records kept in memory before they are
+                           written to the file. Default is 1000.
+    '''
+
+    def __init__(self, path: Union[str, os.PathLike], compact: bool = False, buffer_size: int = 1000) -> None:
+        self.path = path
+        self.compact = compact
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.file = open(path, 'a')
+
+
+    def __enter__(self) -> 'MapsWriter':
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+    def write_map(self, map_id: str, array: np.ndarray, problems: List[Tuple[str, int, int]]) -> None:
+        '''
+        Adds the records of a map to the buffer, flushing it when it is full.
+
+        Args:
+            map_id (str): The id of the map, only written in the compact layout.
+            array (np.ndarray): The array of the map.
+            problems (List[Tuple[str, int, int]]): Name, source and target of each
+                                                   problem of the map.
+        '''
+        grid = json.dumps(array.tolist())
+        if self.compact:
+            map_ref = json.dumps(map_id)
+            self.buffer.append(f'{{"map_id": {map_ref}, "map": {grid}}}\n')
+            for fname, source, target in problems:
+                self.buffer.append(f'{{"problem": {json.dumps(fname)}, "map_id": {map_ref}, "source_destination": [{source}, {target}]}}\n')
+        else:
+            for fname, source, target in problems:
+                self.buffer.append(f'{{"problem": {json.dumps(fname)}, "map": {grid}, "source_destination": [{source}, {target}]}}\n')
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+
+    def flush(self) -> None:
+        '''
+        Writes the buffered records to the file.
+        '''
+        self.file.write(''.join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+
+
+    def close(self) -> None:
+        '''
+        Flushes the buffer and closes the file.
+        '''
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class DatasetCheckpoint:
+    '''
+    The progress of a dataset generation run. It is saved after every completed
+    bucket, and every few maps within a bucket, so a killed run can be resumed,
+    or a dataset extended, from the last commit.
+
+    Attributes:
+        path (Union[str, os.PathLike]): The JSON file of the checkpoint.
+        entropy (int): The root entropy of the dataset seed sequence.
+        next_index (int): The index of the next problem.
+        buckets (Dict[str, Dict]): The progress of each bucket, see bucket.
+    '''
+
+    def __init__(self, path: Union[str, os.PathLike], entropy: int) -> None:
+        self.path = path
+        self.entropy = entropy
+        self.next_index = 0
+        self.buckets = {}
+
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> 'DatasetCheckpoint':
+        '''
+        Loads a checkpoint saved with save.
+
+        Args:
+            path (Union[str, os.PathLike]): The JSON file of the checkpoint.
+
+        Returns:
+            DatasetCheckpoint: The checkpoint.
+        '''
+        with open(path) as f:
+            data = json.load(f)
+        checkpoint = cls(path, data['entropy'])
+        checkpoint.next_index = data['next_index']
+        checkpoint.buckets = data['buckets']
+        return checkpoint
+
+
+    def bucket(self, key: str) -> Dict:
+        '''
+        Returns the progress of a bucket: the number of maps written, the size of
+        its JSON file after the last commit, the index of the next map seed
+        to try, see map_seed, and whether it ran out of new maps.
+
+        Args:
+            key (str): The key of the bucket.
+
+        Returns:
+            Dict: The progress of the bucket.
+        '''
+        return self.buckets.get(key, {'maps': 0, 'json_size': 0, 'next_seed': 0, 'exhausted': False})
+
+
+    def commit(self, key: str, maps: int, json_size: int, next_seed: int, exhausted: bool, next_index: int, **extra) -> None:
+        '''
+        Records the progress of a bucket and saves the checkpoint.
+
+        Args:
+            key (str): The key of the bucket.
+            maps (int): The total number of maps of the bucket.
+            json_size (int): The size of the JSON file of the bucket.
+            next_seed (int): The index of the next map seed to try.
+            exhausted (bool): Whether the bucket ran out of new maps.
+            next_index (int): The index of the next problem.
+            **extra: Other JSON serializable progress of the bucket, such as the
+                     number of PDDL archive shards.
+        '''
+        self.buckets[key] = {'maps': maps, 'json_size': json_size, 'next_seed': next_seed, 'exhausted': exhausted, **extra}
+        self.next_index = next_index
+        self.save()
+
+
+    def save(self) -> None:
+        '''
+        Writes the checkpoint atomically, through a temporary file.
+        '''
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'entropy': self.entropy, 'next_index': self.next_index, 'buckets': self.buckets}, f)
+        os.replace(tmp_path, self.path)
+
+
+def format_map_id(width: int, height: int, obstacles_perc: int, index: int) -> str:
+    '''
+    Returns the id of the index-th map of a (size, obstacle percentage) pair,
+    e.g. m8x8_30_000012. The id holds everything Map.from_seed needs, besides
+    the entropy of the dataset, to regenerate the map.
+
+    Args:
+        width (int): The width of the map.
+        height (int): The height of the map.
+        obstacles_perc (int): The percentage of obstacles in the map.
+        index (int): The index of the seed of the map, see map_seed.
+
+    Returns:
+        str: The id of the map.
+    '''
+    return f'm{width}x{height}_{obstacles_perc}_{index :06d}'
+
+
+def parse_map_id(map_id: str) -> Tuple[int, int, int, int]:
+    '''
+    Parses an id written by format_map_id.
+
+    Args:
+        map_id (str): The id of the map.
+
+    Returns:
+        Tuple[int, int, int, int]: The width, height, obstacle percentage and seed
+            index of the map.
+    '''
+    size, obstacles_perc, index = map_id[1:].split('_')
+    width, height = size.split('x')
+    return int(width), int(height), int(obstacles_perc), int(index)
+
+
+def iter_problems(json_files: Iterable[Union[str, os.PathLike]]) -> Iterator[Tuple[str, np.ndarray, int, int]]:
+    '''
+    Streams the problems of maps JSONL files written by MapsWriter, in either
+    layout, one line at a time.
+
+    Args:
+        json_files (Iterable[Union[str, os.PathLike]]): The paths of the JSONL files.
+
+    Yields:
+        Tuple[str, np.ndarray, int, int]: The name of the problem, the uint8 array
+            of its map, the source and the target node.
+    '''
+    for json_file in json_files:
+        map_id, grid = None, None
+        with open(json_file) as f:
+            for line in f:
+                record = json.loads(line)
+                if 'problem' not in record:
+                    map_id, grid = record['map_id'], np.array(record['map'], dtype=np.uint8)
+                    continue
+                if 'map_id' not in record:
+                    grid = np.array(record['map'], dtype=np.uint8)
+                elif record['map_id'] != map_id:
+                    raise ValueError(f'Problem {record["problem"]} in {json_file} does not follow its map {record["map_id"]}.')
+                source, target = record['source_destination']
+                yield record['problem'], grid, source, target
+
+
+def layout_batches(json_files: Iterable[Union[str, os.PathLike]], batch_size: int, shuffle_buffer: int = 0,
+                   prefetch: int = 2, seed: int = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    '''
+    Streams batches of layouts from maps JSONL files, in the form loaded by
+    navigation_env.load_layout: block, start_pos and goal_pos, with the source
+    and target nodes converted to (row, col). Only the shuffle buffer and the
+    prefetched batches are kept in memory.
+
+    Args:
+        json_files (Iterable[Union[str, os.PathLike]]): The paths of the JSONL files.
+        batch_size (int): The number of layouts in a batch. A batch is cut short
+                          when the size of the maps changes, and the last batch
+                          may be smaller.
+        shuffle_buffer (int, optional): The number of problems kept in the shuffle
+                                        buffer. 0 keeps the order of the files.
+                                        Defaults to 0.
+        prefetch (int, optional): The number of batches prepared ahead by a background
+                                  thread. 0 prepares them in the caller's thread.
+                                  Defaults to 2.
+        seed (int, optional): The seed of the shuffle. Defaults to None.
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The (B, H, W) blocks, the (B, 2)
+            start positions and the (B, 2) goal positions.
+    '''
+    problems = iter_problems(json_files)
+    if shuffle_buffer > 0:
+        problems = _shuffle(problems, shuffle_buffer, np.random.default_rng(seed))
+    batches = _batch_layouts(problems, batch_size)
+    if prefetch > 0:
+        batches = _prefetch(batches, prefetch)
+    yield from batches
+
+
+def _batch_layouts(problems: Iterator[Tuple[str, np.ndarray, int, int]], batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    grids, nodes = [], []
+    for _, grid, source, target in problems:
+        if grids and (len(grids) == batch_size or grid.shape != grids[0].shape):
+            yield _to_layouts(grids, nodes)
+            grids, nodes = [], []
+        grids.append(grid)
+        nodes.append((source, target))
+    if grids:
+        yield _to_layouts(grids, nodes)
+
+
+def _to_layouts(grids: List[np.ndarray], nodes: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    blocks = np.stack(grids)
+    rows, cols = np.divmod(np.array(nodes), blocks.shape[2])
+    return blocks, np.stack([rows[:, 0], cols[:, 0]], axis=1), np.stack([rows[:, 1], cols[:, 1]], axis=1)
+
+
+def _shuffle(items: Iterator, buffer_size: int, rng: np.random.Generator) -> Iterator:
+    buffer = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        i = rng.integers(buffer_size)
+        yield buffer[i]
+        buffer[i] = item
+    for i in rng.permutation(len(buffer)):
+        yield buffer[i]
+
+
+def _prefetch(items: Iterator, size: int) -> Iterator:
+    '''
+    Consumes items in a background thread, keeping at most size of them ready.
+    Exceptions raised by items are re-raised in the caller's thread.
+    '''
+    ready = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((end, None))
+        except BaseException as e:
+            put((end, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = ready.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
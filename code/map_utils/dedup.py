@@ -0,0 +1,122 @@
+import hashlib
+import os
+import numpy as np
+from typing import Union
+from map_utils.map import dihedral_array
+
+__all__ = ['DedupIndex']
+
+
+class DedupIndex:
+    '''
+    An index of the maps already generated, used to reject duplicates. Each map
+    is keyed by a 16 bytes digest of its bit-packed grid and shape, so the memory
+    of the index does not depend on the size of the maps.
+
+    Attributes:
+        symmetric (bool): Whether rotated and reflected copies of a map count as
+                          duplicates. Default is False.
+        path (Union[str, os.PathLike, None]): The .npz file the index is loaded
+                                              from, if it exists, and saved to.
+                                              Default is None.
+        attempts (int): The number of maps passed to add.
+        rejects (int): The number of maps add rejected as duplicates.
+    '''
+
+    def __init__(self, symmetric: bool = False, path: Union[str, os.PathLike, None] = None) -> None:
+        self.symmetric = symmetric
+        self.path = path
+        self.keys = set()
+        self.attempts = 0
+        self.rejects = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+    def __contains__(self, array: np.ndarray) -> bool:
+        return self.key(array) in self.keys
+
+
+    @property
+    def reject_rate(self) -> float:
+        '''
+        The fraction of the maps passed to add that were duplicates.
+        '''
+        return self.rejects / self.attempts if self.attempts > 0 else 0.0
+
+
+    def key(self, array: np.ndarray) -> bytes:
+        '''
+        Computes the key of a map. If the index is symmetric, the key is the
+        smallest digest among the 8 rotations and reflections of the map.
+
+        Args:
+            array (np.ndarray): The array of the map.
+
+        Returns:
+            bytes: The digest of the map.
+        '''
+        if not self.symmetric:
+            return _digest(array)
+        return min(_digest(dihedral_array(array, k)) for k in range(8))
+
+
+    def add(self, array: np.ndarray) -> bool:
+        '''
+        Adds a map to the index if it is not a duplicate.
+
+        Args:
+            array (np.ndarray): The array of the map.
+
+        Returns:
+            bool: True if the map was added, False if it was a duplicate.
+        '''
+        self.attempts += 1
+        key = self.key(array)
+        if key in self.keys:
+            self.rejects += 1
+            return False
+        self.keys.add(key)
+        return True
+
+
+    def save(self, path: Union[str, os.PathLike, None] = None) -> None:
+        '''
+        Saves the keys of the index to a .npz file, atomically through a
+        temporary file, so a killed run leaves the previous index intact.
+
+        Args:
+            path (Union[str, os.PathLike, None], optional): The file to write.
+                                                            Defaults to the attribute path.
+        '''
+        path = self.path if path is None else path
+        digests = np.frombuffer(b''.join(sorted(self.keys)), dtype=np.uint8).reshape(-1, 16)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, digests=digests, symmetric=self.symmetric)
+        os.replace(tmp_path, path)
+
+
+    def load(self, path: Union[str, os.PathLike]) -> None:
+        '''
+        Adds the keys saved in a .npz file to the index.
+
+        Args:
+            path (Union[str, os.PathLike]): The file to read.
+
+        Raises:
+            ValueError: If the file was saved by an index with a different symmetric flag.
+        '''
+        with np.load(path) as data:
+            if bool(data['symmetric']) != self.symmetric:
+                raise ValueError(f'The index in {path} was saved with symmetric={bool(data["symmetric"])}.')
+            self.keys.update(row.tobytes() for row in data['digests'])
+
+
+def _digest(array: np.ndarray) -> bytes:
+    shape = np.array(array.shape, dtype=np.int64).tobytes()
+    return hashlib.blake2b(shape + np.packbits(array != 0).tobytes(), digest_size=16).digest()
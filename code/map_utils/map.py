@@ -1,6 +1,744 @@
-from igraph import Graph
+from collections import deque
+import itertools
 import numpy as np
-from typing import List, Tuple, Self
+from typing import IO, TYPE_CHECKING, Dict, Iterator, List, Tuple, Self, Union
+
+if TYPE_CHECKING:
+    # igraph is imported by generate_graph, the first time a graph is needed:
+    # it takes longer to import than the rest of map_utils together.
+    from igraph import Graph
+
+__all__ = ['NEIGHBOUR_OFFSETS', 'RNGLike', 'get_rng', 'map_seed', 'obstacles_count', 'obstacles_percentage',
+           'neighbour_table', 'carve_obstacles', 'generate_batch', 'label_components', 'free_degrees',
+           'SCALAR_STATS', 'map_stats', 'bfs_distances', 'dihedral_array', 'dihedral_nodes', 'Map']
+
+
+# 4-neighbour offsets (row, col) in the order igraph lists the incident edges
+# of a grid vertex: up, left, right, down.
+NEIGHBOUR_OFFSETS = ((-1, 0), (0, -1), (0, 1), (1, 0))
+# The 8 cells around a cell, in clockwise order: consecutive ones are 4-neighbours.
+_RING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+# Bulk edits of more cells than this relabel the components from scratch, which
+# is cheaper than updating them cell by cell.
+_MAX_INCREMENTAL_CELLS = 16
+# All the orders in which the 4 neighbours of a cell can be visited.
+_PERMUTATIONS = np.array(list(itertools.permutations(range(4))))
+
+# Anything that can be turned into a random source by get_rng.
+RNGLike = Union[np.random.Generator, np.random.RandomState, np.random.SeedSequence, int, None]
+
+
+def get_rng(rng: RNGLike = None) -> Union[np.random.Generator, np.random.RandomState]:
+    '''
+    Returns the random source to draw from. None selects the global np.random
+    state, so code seeded with np.random.seed keeps its results. A Generator or
+    RandomState is returned as is, a seed or SeedSequence gives a new Generator.
+
+    Args:
+        rng (RNGLike, optional): The random source or its seed. Defaults to None.
+
+    Returns:
+        Union[np.random.Generator, np.random.RandomState]: The random source.
+    '''
+    if rng is None:
+        # The RandomState behind the np.random functions.
+        return np.random.random.__self__
+    if isinstance(rng, (np.random.Generator, np.random.RandomState)):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def map_seed(entropy: int, width: int, height: int, obstacles_perc: int, index: int) -> np.random.SeedSequence:
+    '''
+    Returns the seed of the index-th map of a (size, obstacle percentage) pair
+    in a dataset. Every map gets an independent stream, so any map can be
+    regenerated from its index alone, see Map.from_seed.
+
+    Args:
+        entropy (int): The root entropy of the dataset.
+        width (int): The width of the map.
+        height (int): The height of the map.
+        obstacles_perc (int): The percentage of obstacles in the map.
+        index (int): The index of the map.
+
+    Returns:
+        np.random.SeedSequence: The seed of the map.
+    '''
+    return np.random.SeedSequence(entropy, spawn_key=(width, height, obstacles_perc, index))
+
+
+def obstacles_count(width: int, height: int, obstacles_perc: int) -> int:
+    '''
+    Returns the number of obstacles carve_obstacles leaves in a map.
+
+    Args:
+        width (int): The width of the map.
+        height (int): The height of the map.
+        obstacles_perc (int): The percentage of obstacles in the map.
+
+    Returns:
+        int: The number of obstacles.
+    '''
+    return int(np.ceil(width * height * obstacles_perc / 100))
+
+
+def obstacles_percentage(n_obstacles: int, width: int, height: int) -> int:
+    '''
+    Returns the percentage of obstacles of a map with n_obstacles obstacles,
+    rounded down. A map is consistent with an obstacle percentage if it is this
+    one, or if the percentage gives n_obstacles with obstacles_count: they
+    differ for small maps, where e.g. 30% of 16 cells gives 5 obstacles, that
+    is 31%, and for large maps, where e.g. 2 obstacles in 256 cells cannot be
+    created from any percentage.
+
+    Args:
+        n_obstacles (int): The number of obstacles.
+        width (int): The width of the map.
+        height (int): The height of the map.
+
+    Returns:
+        int: The percentage of obstacles.
+    '''
+    return int(100 * n_obstacles // (width * height))
+
+
+def _integers(rng: Union[np.random.Generator, np.random.RandomState], high: int, size: int = None) -> Union[int, np.ndarray]:
+    if isinstance(rng, np.random.Generator):
+        return rng.integers(high, size=size)
+    return rng.randint(high, size=size)
+
+
+def neighbour_table(width: int, height: int) -> np.ndarray:
+    '''
+    Precomputes the 4-neighbours of every cell of a width x height grid.
+
+    Args:
+        width (int): The width of the grid.
+        height (int): The height of the grid.
+
+    Returns:
+        np.ndarray: A (width*height, 4) array. Row i holds the node ids of the
+                    neighbours of node i in NEIGHBOUR_OFFSETS order, -1 where
+                    the neighbour falls outside the grid.
+    '''
+    rows, cols = np.divmod(np.arange(width * height), width)
+    table = np.full((width * height, 4), -1, dtype=np.int64)
+    for k, (dr, dc) in enumerate(NEIGHBOUR_OFFSETS):
+        r, c = rows + dr, cols + dc
+        valid = (r >= 0) & (r < height) & (c >= 0) & (c < width)
+        table[valid, k] = (r * width + c)[valid]
+    return table
+
+
+class _Frontier:
+    '''
+    Unordered frontier of node ids with O(1) add, remove and random pick.
+    Removal swaps the last element into the freed slot.
+    '''
+
+    def __init__(self, capacity: int) -> None:
+        self.nodes = np.empty(capacity, dtype=np.int64)
+        self.position = np.full(capacity, -1, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, node: int) -> bool:
+        return self.position[node] >= 0
+
+    def add(self, node: int) -> None:
+        self.nodes[self.size] = node
+        self.position[node] = self.size
+        self.size += 1
+
+    def pop(self, k: int) -> int:
+        node = self.nodes[k]
+        self.size -= 1
+        last = self.nodes[self.size]
+        self.nodes[k] = last
+        self.position[last] = k
+        self.position[node] = -1
+        return int(node)
+
+
+class _StackFrontier(_Frontier):
+    '''
+    Frontier of node ids with O(1) add, random pick and pop of the most
+    recently added node. Besides the swap-remove slots of _Frontier, used for
+    the random pick, the nodes are pushed on an append-only stack. Every node
+    is added at most once, so a node removed by a random pick is left on the
+    stack as a tombstone and skipped when it reaches the top, which makes the
+    pop of the last node amortized O(1).
+    '''
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__(capacity)
+        self.stack = np.empty(capacity, dtype=np.int64)
+        self.top = 0
+
+    def add(self, node: int) -> None:
+        super().add(node)
+        self.stack[self.top] = node
+        self.top += 1
+
+    def pop_last(self) -> int:
+        while self.position[self.stack[self.top - 1]] < 0:
+            self.top -= 1
+        self.top -= 1
+        return self.pop(int(self.position[self.stack[self.top]]))
+
+
+class _OrderedFrontier:
+    '''
+    Insertion-ordered frontier of node ids. Every node is added at most once,
+    so nodes are stored in append-only slots and a Fenwick tree over the
+    occupied slots gives O(log n) add, remove and k-th element lookup.
+    '''
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.nodes = [0] * capacity
+        self.tree = [0] * (capacity + 1)
+        self.queued = np.zeros(capacity, dtype=bool)
+        self.next_slot = 0
+        self.size = 0
+        self.top_bit = 1 << (capacity.bit_length() - 1) if capacity > 0 else 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, node: int) -> bool:
+        return self.queued[node]
+
+    def _update(self, slot: int, delta: int) -> None:
+        slot += 1
+        while slot <= self.capacity:
+            self.tree[slot] += delta
+            slot += slot & -slot
+
+    def add(self, node: int) -> None:
+        self.nodes[self.next_slot] = node
+        self._update(self.next_slot, 1)
+        self.queued[node] = True
+        self.next_slot += 1
+        self.size += 1
+
+    def pop(self, k: int) -> int:
+        slot, remaining, bit = 0, k + 1, self.top_bit
+        while bit:
+            nxt = slot + bit
+            if nxt <= self.capacity and self.tree[nxt] < remaining:
+                slot = nxt
+                remaining -= self.tree[nxt]
+            bit >>= 1
+        node = self.nodes[slot]
+        self._update(slot, -1)
+        self.queued[node] = False
+        self.size -= 1
+        return node
+
+
+def carve_obstacles(width: int, height: int, obstacles_perc: int, jump_perc: int = 25,
+                    shuffle_edges: bool = True, legacy: bool = False, rng: RNGLike = None) -> np.ndarray:
+    '''
+    Creates the obstacles of a width x height map with a random walk. Starting
+    from a random cell, the walk marks cells as crossable until only the
+    requested percentage of obstacles is left. At each step the next cell is
+    the most recently discovered one or, with probability jump_perc, a random
+    cell of the frontier.
+
+    Args:
+        width (int): The width of the map.
+        height (int): The height of the map.
+        obstacles_perc (int): The percentage of obstacles in the map.
+        jump_perc (int, optional): Probability of taking a random frontier cell
+                                   instead of the last discovered one. Defaults to 25.
+        shuffle_edges (bool, optional): Whether to visit the neighbours of a cell
+                                        in random order. Defaults to True.
+        legacy (bool, optional): Whether to reproduce, for a given np.random seed,
+                                 the exact output of the original igraph walk. This
+                                 keeps the frontier in insertion order, so each step
+                                 costs O(log n) instead of O(1). Defaults to False.
+        rng (RNGLike, optional): The random source, see get_rng. Defaults to None.
+
+    Returns:
+        np.ndarray: A (height, width) uint8 array. 0 means the cell is crossable,
+                    1 means it is an obstacle.
+    '''
+    n_cells = width * height
+    n_free = n_cells - obstacles_count(width, height, obstacles_perc)
+    table = neighbour_table(width, height)
+    visited = np.zeros(n_cells, dtype=bool)
+    rng = get_rng(rng)
+    if legacy:
+        _legacy_walk(table, visited, n_free, jump_perc, shuffle_edges, rng)
+    elif n_free > 0:
+        _fast_walk(table, visited, n_free, jump_perc, shuffle_edges, rng)
+    return (~visited).astype(np.uint8).reshape(height, width)
+
+
+def _legacy_walk(table: np.ndarray, visited: np.ndarray, n_free: int, jump_perc: int, shuffle_edges: bool,
+                 rng: Union[np.random.Generator, np.random.RandomState]) -> None:
+    '''
+    Random walk drawing from rng in the same order as the original igraph
+    implementation of Map.create_obstacles drew from np.random.
+    '''
+    n_cells = len(visited)
+    frontier = _OrderedFrontier(n_cells)
+    frontier.add(int(rng.choice(range(0, n_cells), 1, replace=False)[0]))
+    for _ in range(n_free):
+        if rng.random() <= jump_perc / 100:
+            k = int(rng.choice(len(frontier), 1)[0])
+        else:
+            k = len(frontier) - 1
+        current = frontier.pop(k)
+        visited[current] = True
+        neighbours = [n for n in table[current].tolist() if n >= 0]
+        if shuffle_edges:
+            rng.shuffle(neighbours)
+        for n in neighbours:
+            if not visited[n] and n not in frontier:
+                frontier.add(n)
+
+
+def _fast_walk(table: np.ndarray, visited: np.ndarray, n_free: int, jump_perc: int, shuffle_edges: bool,
+               rng: Union[np.random.Generator, np.random.RandomState]) -> None:
+    '''
+    Random walk over an O(1) frontier: jumps pick a uniform random cell of the
+    frontier, the other steps the most recently discovered one, as the legacy
+    walk. All the random draws are taken upfront in bulk.
+    '''
+    n_cells = len(visited)
+    frontier = _StackFrontier(n_cells)
+    frontier.add(int(_integers(rng, n_cells)))
+    jumps = rng.random(n_free) <= jump_perc / 100
+    picks = rng.random(n_free)
+    if shuffle_edges:
+        # Permuting all 4 slots, padding included, shuffles the valid neighbours uniformly.
+        orders = _PERMUTATIONS[_integers(rng, 24, size=n_free)]
+    for step in range(n_free):
+        current = frontier.pop(int(picks[step] * len(frontier))) if jumps[step] else frontier.pop_last()
+        visited[current] = True
+        row = table[current]
+        if shuffle_edges:
+            row = row[orders[step]]
+        for n in row:
+            if n >= 0 and not visited[n] and n not in frontier:
+                frontier.add(n)
+
+
+def generate_batch(n: int, width: int, height: int, obstacles_perc: int, jump_perc: int = 25,
+                   shuffle_edges: bool = True, seed: Union[int, np.random.SeedSequence, np.random.Generator] = None,
+                   chunk_size: int = 1024) -> np.ndarray:
+    '''
+    Generates n maps at once with the random walk of carve_obstacles. The walks
+    of all the maps advance together, one step per iteration, on (n, cells)
+    frontier arrays, so no Map or Graph object is created.
+
+    Args:
+        n (int): The number of maps.
+        width (int): The width of the maps.
+        height (int): The height of the maps.
+        obstacles_perc (int): The percentage of obstacles in the maps.
+        jump_perc (int, optional): Probability of taking a random frontier cell
+                                   instead of the last discovered one. Defaults to 25.
+        shuffle_edges (bool, optional): Whether to visit the neighbours of a cell
+                                        in random order. Defaults to True.
+        seed (Union[int, np.random.SeedSequence, np.random.Generator], optional): The
+            seed of the random generator, or a Generator to draw from. Defaults to None.
+        chunk_size (int, optional): The maximum number of maps walked together,
+                                    which bounds the memory of the frontier
+                                    arrays. Defaults to 1024.
+
+    Returns:
+        np.ndarray: A (n, height, width) uint8 array. 0 means the cell is crossable,
+                    1 means it is an obstacle.
+    '''
+    rng = np.random.default_rng(seed)
+    n_cells = width * height
+    n_free = n_cells - obstacles_count(width, height, obstacles_perc)
+    table = neighbour_table(width, height)
+    maps = np.ones((n, height, width), dtype=np.uint8)
+    if n_free <= 0:
+        return maps
+    for start in range(0, n, chunk_size):
+        visited = _batch_walk(table, min(chunk_size, n - start), n_free, jump_perc, shuffle_edges, rng)
+        maps[start:start + chunk_size] = (~visited).reshape(-1, height, width)
+    return maps
+
+
+def _batch_walk(table: np.ndarray, n: int, n_free: int, jump_perc: int, shuffle_edges: bool,
+                rng: np.random.Generator) -> np.ndarray:
+    '''
+    Runs n random walks of n_free steps together. Row i of the arrays holds the
+    frontier of walk i, as in _StackFrontier: swap-remove slots for the jumps
+    and a stack with tombstones for the other steps.
+
+    Returns:
+        np.ndarray: A (n, cells) boolean array with the cells visited by each walk.
+    '''
+    n_cells = len(table)
+    maps = np.arange(n)
+    visited = np.zeros((n, n_cells), dtype=bool)
+    nodes = np.empty((n, n_cells), dtype=np.int32)
+    position = np.full((n, n_cells), -1, dtype=np.int32)
+    stack = np.empty((n, n_cells), dtype=np.int32)
+    size = np.ones(n, dtype=np.int32)
+    top = np.ones(n, dtype=np.int32)
+    nodes[:, 0] = rng.integers(n_cells, size=n)
+    stack[:, 0] = nodes[:, 0]
+    position[maps, nodes[:, 0]] = 0
+    for _ in range(n_free):
+        jumps = rng.random(n) <= jump_perc / 100
+        picks = (rng.random(n) * size).astype(np.int32)
+        # Skip the tombstones of the cells removed by jumps from the top of the stacks.
+        rows = maps[~jumps]
+        while True:
+            dead = position[rows, stack[rows, top[rows] - 1]] < 0
+            if not dead.any():
+                break
+            rows = rows[dead]
+            top[rows] -= 1
+        rows = maps[~jumps]
+        top[rows] -= 1
+        k = np.where(jumps, picks, 0)
+        k[rows] = position[rows, stack[rows, top[rows]]]
+        current = nodes[maps, k]
+        size -= 1
+        last = nodes[maps, size]
+        nodes[maps, k] = last
+        position[maps, last] = k
+        position[maps, current] = -1
+        visited[maps, current] = True
+        neighbours = table[current]
+        if shuffle_edges:
+            neighbours = np.take_along_axis(neighbours, _PERMUTATIONS[rng.integers(24, size=n)], axis=1)
+        for slot in range(4):
+            neighbour = neighbours[:, slot]
+            valid = neighbour >= 0
+            cell = np.where(valid, neighbour, 0)
+            add = valid & ~visited[maps, cell] & (position[maps, cell] < 0)
+            added = maps[add]
+            nodes[added, size[add]] = neighbour[add]
+            position[added, neighbour[add]] = size[add]
+            stack[added, top[add]] = neighbour[add]
+            size += add
+            top += add
+    return visited
+
+
+def label_components(array: np.ndarray) -> Tuple[np.ndarray, int]:
+    '''
+    Labels the connected components of the crossable cells of a map with an
+    array-based union-find. Each round hooks the root of every edge on the
+    smaller of its two roots and compresses the paths by pointer jumping, so
+    the work per round is O(cells).
+
+    Args:
+        array (np.ndarray): A 2D array representing the map. 0 means the cell is
+                            crossable, 1 means it is an obstacle.
+
+    Returns:
+        Tuple[np.ndarray, int]: A 2D int32 array with the component of each cell,
+            numbered from 0 by their first cell in row-major order, -1 for the
+            obstacles, and the number of components.
+    '''
+    height, width = array.shape
+    free = array.flatten() == 0
+    nodes = np.arange(width * height).reshape(height, width)
+    vertical = free[nodes[1:, :]] & free[nodes[:-1, :]]
+    horizontal = free[nodes[:, 1:]] & free[nodes[:, :-1]]
+    u = np.concatenate([nodes[1:, :][vertical], nodes[:, 1:][horizontal]])
+    v = np.concatenate([nodes[:-1, :][vertical], nodes[:, :-1][horizontal]])
+    parent = np.arange(width * height)
+    while True:
+        pu, pv = parent[u], parent[v]
+        hook = pu != pv
+        if not hook.any():
+            break
+        np.minimum.at(parent, np.maximum(pu, pv)[hook], np.minimum(pu, pv)[hook])
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+    labels = np.full(width * height, -1, dtype=np.int32)
+    roots, labels[free] = np.unique(parent[free], return_inverse=True)
+    return labels.reshape(height, width), len(roots)
+
+
+def _first_cells(labels: np.ndarray) -> np.ndarray:
+    '''
+    Returns the first cell of each component of labels numbered as in
+    label_components: the running maximum of the labels grows by one at the
+    first cell of every component.
+    '''
+    running = np.maximum.accumulate(labels.ravel())
+    return np.flatnonzero(np.diff(running, prepend=-1) > 0)
+
+
+def _renumber_components(labels: np.ndarray, n_labels: int) -> Tuple[int, np.ndarray]:
+    '''
+    Renumbers in place labels that use any n_labels ids, some of them possibly
+    unused, as label_components would number them: from 0 by their first cell.
+
+    Returns:
+        Tuple[int, np.ndarray]: The number of components and their first cells.
+    '''
+    flat = labels.ravel()
+    crossable = np.flatnonzero(flat >= 0)
+    firsts = np.full(n_labels, len(flat), dtype=np.int64)
+    np.minimum.at(firsts, flat[crossable], crossable)
+    order = np.argsort(firsts, kind='stable')
+    n = int(np.count_nonzero(firsts < len(flat)))
+    remap = np.empty(n_labels, dtype=labels.dtype)
+    remap[order] = np.arange(n_labels)
+    flat[crossable] = remap[flat[crossable]]
+    return n, firsts[order[:n]]
+
+
+def _ring_connected(array: np.ndarray, row: int, col: int) -> bool:
+    '''
+    Checks whether the crossable 4-neighbours of a cell are connected through
+    the 8 cells around it, so turning the cell into an obstacle cannot split
+    its component.
+    '''
+    height, width = array.shape
+    free = [0 <= row + dr < height and 0 <= col + dc < width and array[row + dr, col + dc] == 0
+            for dr, dc in _RING_OFFSETS]
+    if all(free):
+        return True
+    # Walk the ring from an obstacle, counting the runs of crossable cells
+    # that hold a 4-neighbour (the odd positions of the ring).
+    start = free.index(False)
+    runs, counted = 0, False
+    for k in range(start, start + 8):
+        if not free[k % 8]:
+            counted = False
+            continue
+        if k % 2 == 1 and not counted:
+            runs += 1
+            counted = True
+    return runs <= 1
+
+
+def _cut_pieces(array: np.ndarray, starts: List[int]) -> List[List[int]]:
+    '''
+    Finds the pieces a component was cut into after a cell became an obstacle,
+    given the crossable 4-neighbours of the cell. The crossable cells are
+    searched from every neighbour in lockstep, one cell per search per round,
+    and searches that meet are joined. A group of searches that runs out of
+    cells before meeting the others is a piece cut off. The search stops when
+    a single group is left, so its cost depends on the pieces cut off and on
+    the detours between the neighbours, not on the size of the map.
+
+    Returns:
+        List[List[int]]: The cells of each piece cut off, without the piece of
+            the last group.
+    '''
+    height, width = array.shape
+    owner = {start: i for i, start in enumerate(starts)}
+    parent = list(range(len(starts)))
+    queues = [deque([start]) for start in starts]
+    members = [[start] for start in starts]
+    active = list(range(len(starts)))
+    groups = len(starts)
+    pieces = []
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    while groups > 1:
+        for i in list(active):
+            if groups == 1:
+                break
+            if not queues[i]:
+                active.remove(i)
+                root = find(i)
+                if all(find(j) != root for j in active):
+                    pieces.append([cell for j in range(len(starts)) if find(j) == root for cell in members[j]])
+                    groups -= 1
+                continue
+            row, col = divmod(queues[i].popleft(), width)
+            for dr, dc in NEIGHBOUR_OFFSETS:
+                r, c = row + dr, col + dc
+                if not (0 <= r < height and 0 <= c < width) or array[r, c] != 0:
+                    continue
+                cell = r * width + c
+                j = owner.get(cell)
+                if j is None:
+                    owner[cell] = i
+                    members[i].append(cell)
+                    queues[i].append(cell)
+                elif find(j) != find(i):
+                    parent[find(j)] = find(i)
+                    groups -= 1
+    return pieces
+
+
+def free_degrees(arrays: np.ndarray) -> np.ndarray:
+    '''
+    Counts the crossable 4-neighbours of every cell, as the sum of the shifted
+    masks of the crossable cells, that is a convolution with a cross kernel.
+
+    Args:
+        arrays (np.ndarray): A (H, W) map or a (N, H, W) stack of maps.
+
+    Returns:
+        np.ndarray: An int8 array with the shape of arrays. The degree of the
+                    obstacles is counted too.
+    '''
+    free = np.asarray(arrays) == 0
+    padded = np.pad(free, [(0, 0)] * (free.ndim - 2) + [(1, 1), (1, 1)]).astype(np.int8)
+    return padded[..., :-2, 1:-1] + padded[..., 2:, 1:-1] + padded[..., 1:-1, :-2] + padded[..., 1:-1, 2:]
+
+
+# The statistics of map_stats with a single value per map, which can be
+# compared with a threshold.
+SCALAR_STATS = ('density', 'free_cells', 'components', 'largest_component', 'dead_ends', 'corridors', 'junctions')
+
+
+def map_stats(arrays: np.ndarray) -> Dict[str, np.ndarray]:
+    '''
+    Computes the statistics of a stack of maps at once:
+        density: the fraction of obstacles.
+        free_cells: the number of crossable cells.
+        components: the number of connected components of the crossable cells.
+        largest_component: the number of cells of the largest component.
+        dead_ends: the crossable cells with exactly 1 crossable neighbour.
+        corridors: the crossable cells with exactly 2 crossable neighbours.
+        junctions: the crossable cells with 3 or 4 crossable neighbours.
+        degree_histogram: the number of crossable cells with 0 to 4 crossable
+                          neighbours, see free_degrees.
+    The components of all the maps are labelled by a single call to
+    label_components, on the maps stacked with a row of obstacles between them.
+
+    Args:
+        arrays (np.ndarray): A (N, H, W) stack of maps. 0 means the cell is
+                             crossable, 1 means it is an obstacle.
+
+    Returns:
+        Dict[str, np.ndarray]: Each statistic as a (N,) array, and degree_histogram
+            as a (N, 5) array.
+    '''
+    arrays = np.asarray(arrays)
+    n, height, width = arrays.shape
+    free = arrays == 0
+    degrees = free_degrees(arrays)
+    maps = np.broadcast_to(np.arange(n)[:, None, None], arrays.shape)
+    histogram = np.bincount(maps[free] * 5 + degrees[free], minlength=5 * n).reshape(n, 5)
+
+    stacked = np.ones((n, height + 1, width), dtype=np.uint8)
+    stacked[:, :height] = ~free
+    labels, n_labels = label_components(stacked.reshape(-1, width))
+    labels = labels.reshape(n, height + 1, width)[:, :height]
+    label_map = np.zeros(n_labels, dtype=np.int64)
+    label_map[labels[free]] = maps[free]
+    largest = np.zeros(n, dtype=np.int64)
+    np.maximum.at(largest, label_map, np.bincount(labels[free], minlength=n_labels))
+
+    free_cells = free.reshape(n, -1).sum(axis=1)
+    return {
+        'density': 1 - free_cells / (height * width),
+        'free_cells': free_cells,
+        'components': np.bincount(label_map, minlength=n),
+        'largest_component': largest,
+        'dead_ends': histogram[:, 1],
+        'corridors': histogram[:, 2],
+        'junctions': histogram[:, 3] + histogram[:, 4],
+        'degree_histogram': histogram,
+    }
+
+
+def bfs_distances(array: np.ndarray, sources: List[int]) -> np.ndarray:
+    '''
+    Computes the shortest path distances from many sources at once. The BFS of
+    all the sources advances together, one level per iteration, on flat arrays
+    of (source, node) pairs, so every node is expanded once per source.
+
+    Args:
+        array (np.ndarray): A 2D array representing the map. 0 means the cell is
+                            crossable, 1 means it is an obstacle.
+        sources (List[int]): The source nodes.
+
+    Returns:
+        np.ndarray: A (len(sources), cells) array with the distance of each node
+                    from each source, -1 if it is not reachable. The dtype is int16
+                    if it can hold every distance, int32 otherwise.
+    '''
+    height, width = array.shape
+    n_cells = width * height
+    table = neighbour_table(width, height)
+    free = array.flatten() == 0
+    sources = np.asarray(sources, dtype=np.int64)
+    dtype = np.int16 if n_cells <= np.iinfo(np.int16).max else np.int32
+    distances = np.full((len(sources), n_cells), -1, dtype=dtype)
+    rows = np.arange(len(sources))[free[sources]]
+    nodes = sources[free[sources]]
+    distances[rows, nodes] = 0
+    level = 0
+    while len(rows) > 0:
+        level += 1
+        rows = np.repeat(rows, 4)
+        nodes = table[nodes].flatten()
+        keep = nodes >= 0
+        rows, nodes = rows[keep], nodes[keep]
+        keep = free[nodes] & (distances[rows, nodes] < 0)
+        rows, nodes = np.divmod(np.unique(rows[keep] * n_cells + nodes[keep]), n_cells)
+        distances[rows, nodes] = level
+    return distances
+
+
+def dihedral_array(arrays: np.ndarray, k: int) -> np.ndarray:
+    '''
+    Returns the k-th of the 8 rotations and reflections of one or more maps:
+    variants 0-3 rotate the map by k * 90 degrees counterclockwise, variants
+    4-7 rotate its left-right mirror image. The result is a view, nothing is
+    copied.
+
+    Args:
+        arrays (np.ndarray): A (..., H, W) array of maps, such as a single map
+                             or a (N, H, W) batch.
+        k (int): The variant, from 0 to 7. 0 is the identity.
+
+    Returns:
+        np.ndarray: A (..., H, W) view, or (..., W, H) for odd k.
+    '''
+    if k < 0 or k >= 8:
+        raise ValueError(f'Variant must be between 0 and 7, got {k}.')
+    if k >= 4:
+        arrays = np.flip(arrays, axis=-1)
+    return np.rot90(arrays, k % 4, axes=(-2, -1))
+
+
+def dihedral_nodes(nodes: Union[int, np.ndarray], width: int, height: int, k: int) -> Union[int, np.ndarray]:
+    '''
+    Maps the node ids of a width x height map to the ids of the same cells in
+    its k-th variant, see dihedral_array.
+
+    Args:
+        nodes (Union[int, np.ndarray]): A node or an array of nodes.
+        width (int): The width of the original map.
+        height (int): The height of the original map.
+        k (int): The variant, from 0 to 7.
+
+    Returns:
+        Union[int, np.ndarray]: The nodes in the variant, with its own width.
+    '''
+    if k < 0 or k >= 8:
+        raise ValueError(f'Variant must be between 0 and 7, got {k}.')
+    rows, cols = np.divmod(nodes, width)
+    if k >= 4:
+        cols = width - 1 - cols
+    for _ in range(k % 4):
+        # np.rot90 moves cell (r, c) of a H x W array to (W - 1 - c, r).
+        rows, cols = width - 1 - cols, rows
+        width, height = height, width
+    return rows * width + cols
+
 
 class Map:
     '''
@@ -9,8 +747,11 @@ class Map:
     Attributes:
         width (int): The width of the map.
         height (int): The height of the map.
-        obstacles_perc (int): The percentage of obstacles in the map.
-        g (Graph): The graph representing the map.
+        obstacles_perc (int): The percentage of obstacles in the map. For maps
+                        built from an array or edited, it is rounded down, see
+                        obstacles_percentage.
+        g (Graph): The graph representing the map. It is built from array the
+                    first time it is accessed.
         array (np.array): A 2D array representing the map. 0 means the cell is
                             crossable, 1 means it is an obstacle.
         jump_perc (int): Probability of taking a random node while building
@@ -18,43 +759,384 @@ class Map:
                         grouped. Default is 25.
         shuffle_edges (bool): Whether to shuffle the edges of the graph while
                             building the map. Default is True.
+        legacy_carving (bool): Whether to create the obstacles with the walk of the
+                            original igraph implementation, which gives the same
+                            map for a given np.random seed. Default is False.
+        rng (Union[np.random.Generator, np.random.RandomState, None]): The random
+                            source of create_obstacles and of the selection of
+                            sources and targets. None draws from the global
+                            np.random state. Default is None.
     '''
-    g : Graph = None
-    array : np.array = None
+    _g : 'Graph' = None
+    _array : np.array = None
+    _pddl_static : str = None
+    _distances : dict = None
+    _components : Tuple[np.ndarray, int, np.ndarray] = None
+    _n_obstacles : int = None
+    _node_index : Tuple[np.ndarray, np.ndarray, np.ndarray] = None
 
 
-    def __init__(self, width: int, height: int, obstacles_perc: int, array: np.ndarray = None, jump_perc: int = 25, shuffle_edges: bool = True) -> None:
+    def __init__(self, width: int, height: int, obstacles_perc: int, array: np.ndarray = None, jump_perc: int = 25, shuffle_edges: bool = True, legacy_carving: bool = False, rng: RNGLike = None) -> None:
         self.width = width
         self.height = height
         self.obstacles_perc = obstacles_perc
         self.jump_perc = jump_perc
         self.shuffle_edges = shuffle_edges
-        self.generate_graph()
+        self.legacy_carving = legacy_carving
+        self.rng = None if rng is None else get_rng(rng)
         self.init_obstacles(array)
-        if array is None:
-            arr = [0 if self.g.vs[i]["crossable"] else 1 for i in range(self.g.vcount())]
-            self.array = np.array(arr).reshape(self.width, self.height)
-        else:
-            self.array = array
         self.check_values()
 
 
+    @property
+    def g(self) -> 'Graph':
+        '''
+        The graph representing the map, generated on first access.
+        '''
+        if self._g is None:
+            self.generate_graph()
+        return self._g
+
+
+    @property
+    def array(self) -> np.ndarray:
+        '''
+        A 2D array representing the map. 0 means the cell is crossable, 1 means
+        it is an obstacle.
+        '''
+        return self._array
+
+
+    @array.setter
+    def array(self, array: np.ndarray) -> None:
+        '''
+        Sets the array of the map, updating the graph if it was already generated
+        and dropping the cached PDDL sections and distances. To change a few cells,
+        see set_obstacles and clear_obstacles.
+        '''
+        self._array = array
+        self._n_obstacles = int(np.count_nonzero(array))
+        self._pddl_static = None
+        self._distances = {}
+        self._components = None
+        self._node_index = None
+        if self._g is not None:
+            self._g.vs['crossable'] = (array.flatten() == 0).tolist()
+
+
+    @property
+    def components(self) -> np.ndarray:
+        '''
+        A 2D array with the connected component of each crossable cell, -1 for
+        the obstacles. It is computed with label_components on first access, and
+        updated in place by set_obstacles and clear_obstacles.
+        '''
+        if self._components is None:
+            self._label_components()
+        return self._components[0]
+
+
+    @property
+    def n_components(self) -> int:
+        '''
+        The number of connected components of the crossable cells.
+        '''
+        if self._components is None:
+            self._label_components()
+        return self._components[1]
+
+
+    def _label_components(self) -> None:
+        labels, n = label_components(self.array)
+        self._components = (labels, n, _first_cells(labels))
+
+
+    def is_connected(self) -> bool:
+        '''
+        Checks whether every crossable cell can be reached from every other one.
+
+        Returns:
+            bool: True if the crossable cells form at most one component.
+        '''
+        return self.n_components <= 1
+
+
+    def node_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Returns the index of the crossable nodes, grouped by component. It is built
+        once from components and dropped when the array changes, so the nodes of a
+        component, and the position of a node among them, are found in O(1).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The read-only arrays nodes,
+                starts and position. nodes holds the crossable nodes sorted by
+                component and id, the nodes of component c are
+                nodes[starts[c]:starts[c + 1]], and nodes[position[node]] == node
+                for crossable nodes, while position is -1 for obstacles.
+        '''
+        if self._node_index is None:
+            labels = self.components.flatten()
+            crossable = np.flatnonzero(labels >= 0)
+            nodes = crossable[np.argsort(labels[crossable], kind='stable')]
+            starts = np.zeros(self.n_components + 1, dtype=np.int64)
+            np.cumsum(np.bincount(labels[crossable], minlength=self.n_components), out=starts[1:])
+            position = np.full(len(labels), -1, dtype=np.int64)
+            position[nodes] = np.arange(len(nodes))
+            self._set_node_index(nodes, starts, position)
+        return self._node_index
+
+
+    def component_nodes(self, node: int = None) -> np.ndarray:
+        '''
+        Returns the crossable nodes in the component of node.
+
+        Args:
+            node (int, optional): A crossable node. Defaults to None, which selects
+                                  the largest component.
+
+        Returns:
+            np.ndarray: The sorted ids of the nodes of the component, a read-only view
+                        on node_index.
+        '''
+        nodes, starts, position = self.node_index()
+        if node is not None:
+            if position[node] < 0:
+                return nodes[:0]
+            label = self.components.flat[node]
+        elif self.n_components == 0:
+            return nodes[:0]
+        else:
+            label = np.argmax(np.diff(starts))
+        return nodes[starts[label]:starts[label + 1]]
+
+
+    def repair(self) -> None:
+        '''
+        Makes the crossable cells connected by turning every component but the
+        largest into obstacles. The attribute obstacles_perc is updated as in
+        from_array.
+        '''
+        if self.is_connected():
+            return
+        array = np.ones(self.width * self.height, dtype=self.array.dtype)
+        array[self.component_nodes()] = 0
+        self.array = array.reshape(self.height, self.width)
+        self.obstacles_perc = obstacles_percentage(self._n_obstacles, self.width, self.height)
+
+
+    def set_obstacle(self, node: int) -> None:
+        '''
+        Turns a cell into an obstacle, see set_obstacles.
+
+        Args:
+            node (int): The node of the cell.
+        '''
+        self._edit_cells(np.array([node]), 1)
+
+
+    def clear_obstacle(self, node: int) -> None:
+        '''
+        Makes a cell crossable, see clear_obstacles.
+
+        Args:
+            node (int): The node of the cell.
+        '''
+        self._edit_cells(np.array([node]), 0)
+
+
+    def set_obstacles(self, cells: np.ndarray) -> None:
+        '''
+        Turns cells into obstacles, updating the caches of the map instead of
+        dropping them: the crossable attribute of the edited vertices of the
+        graph, if it was generated, and the components and node index, cell by
+        cell. Only the PDDL sections and the distances are dropped. An edit that
+        does not split or join components costs O(1) for the components, plus a
+        memory move for the node index. A cut is resolved by searching from the
+        neighbours of the cell until they meet, then the components are
+        renumbered with a few vectorized passes and the node index is rebuilt
+        on access. Bulk edits of many cells relabel the components from scratch.
+        The array is edited in place, after copying it if it is read-only, and
+        obstacles_perc is updated as in from_array.
+
+        Args:
+            cells (np.ndarray): A boolean (height, width) mask of the cells, or
+                                an array of their nodes.
+        '''
+        self._edit_cells(self._cell_nodes(cells), 1)
+
+
+    def clear_obstacles(self, cells: np.ndarray) -> None:
+        '''
+        Makes cells crossable, updating the caches of the map as set_obstacles.
+
+        Args:
+            cells (np.ndarray): A boolean (height, width) mask of the cells, or
+                                an array of their nodes.
+        '''
+        self._edit_cells(self._cell_nodes(cells), 0)
+
+
+    def _cell_nodes(self, cells: np.ndarray) -> np.ndarray:
+        cells = np.asarray(cells)
+        if cells.dtype == bool:
+            if cells.shape != (self.height, self.width):
+                raise ValueError(f'Mask shape {cells.shape} does not match the map ({self.height}, {self.width}).')
+            return np.flatnonzero(cells)
+        return cells.ravel().astype(np.int64)
+
+
+    def _edit_cells(self, nodes: np.ndarray, value: int) -> None:
+        if len(nodes) > 0 and (nodes.min() < 0 or nodes.max() >= self.width * self.height):
+            raise ValueError(f'Nodes must be between 0 and {self.width * self.height - 1}.')
+        nodes = np.unique(nodes)
+        nodes = nodes[self.array.flat[nodes] != value]
+        if len(nodes) == 0:
+            return
+        if not self._array.flags.writeable:
+            self._array = self._array.copy()
+        self._n_obstacles += len(nodes) if value else -len(nodes)
+        self.obstacles_perc = obstacles_percentage(self._n_obstacles, self.width, self.height)
+        self._pddl_static = None
+        self._distances = {}
+        if self._g is not None:
+            self._g.vs.select(nodes.tolist())['crossable'] = value == 0
+        if self._components is None or len(nodes) > _MAX_INCREMENTAL_CELLS:
+            self._array.flat[nodes] = value
+            self._components = None
+            self._node_index = None
+            return
+        for node in nodes.tolist():
+            self._array.flat[node] = value
+            if value:
+                self._update_components_obstacle(node)
+            else:
+                self._update_components_free(node)
+
+
+    def _update_components_free(self, node: int) -> None:
+        labels, n, firsts = self._components
+        row, col = divmod(node, self.width)
+        neighbours = {int(labels[row + dr, col + dc]) for dr, dc in NEIGHBOUR_OFFSETS
+                      if 0 <= row + dr < self.height and 0 <= col + dc < self.width}
+        neighbours.discard(-1)
+        if len(neighbours) == 1 and node > firsts[min(neighbours)]:
+            label = min(neighbours)
+            labels.flat[node] = label
+            self._insert_node_index(node, label)
+            return
+        # A new component, a merge, or a component whose first cell changes:
+        # the order of the labels may change.
+        if not neighbours:
+            labels.flat[node] = n
+            n += 1
+        else:
+            label = min(neighbours)
+            labels.flat[node] = label
+            if len(neighbours) > 1:
+                labels[np.isin(labels, list(neighbours))] = label
+        self._components = (labels, *_renumber_components(labels, n))
+        self._node_index = None
+
+
+    def _update_components_obstacle(self, node: int) -> None:
+        labels, n, firsts = self._components
+        row, col = divmod(node, self.width)
+        label = int(labels.flat[node])
+        labels.flat[node] = -1
+        connected = _ring_connected(self.array, row, col)
+        if connected and node != firsts[label]:
+            self._delete_node_index(node, label)
+            return
+        # The component may be split, lose its first cell or disappear.
+        if not connected:
+            starts = [(row + dr) * self.width + col + dc for dr, dc in NEIGHBOUR_OFFSETS
+                      if 0 <= row + dr < self.height and 0 <= col + dc < self.width and self.array[row + dr, col + dc] == 0]
+            for cells in _cut_pieces(self.array, starts):
+                labels.flat[cells] = n
+                n += 1
+        self._components = (labels, *_renumber_components(labels, n))
+        self._node_index = None
+
+
+    def _insert_node_index(self, node: int, label: int) -> None:
+        if self._node_index is None:
+            return
+        nodes, starts, position = self._node_index
+        i = int(starts[label] + np.searchsorted(nodes[starts[label]:starts[label + 1]], node))
+        nodes = np.insert(nodes, i, node)
+        starts = starts.copy()
+        starts[label + 1:] += 1
+        position = position.copy()
+        position[nodes[i + 1:]] += 1
+        position[node] = i
+        self._set_node_index(nodes, starts, position)
+
+
+    def _delete_node_index(self, node: int, label: int) -> None:
+        if self._node_index is None:
+            return
+        nodes, starts, position = self._node_index
+        i = int(position[node])
+        nodes = np.delete(nodes, i)
+        starts = starts.copy()
+        starts[label + 1:] -= 1
+        position = position.copy()
+        position[nodes[i:]] -= 1
+        position[node] = -1
+        self._set_node_index(nodes, starts, position)
+
+
+    def _set_node_index(self, nodes: np.ndarray, starts: np.ndarray, position: np.ndarray) -> None:
+        for a in (nodes, starts, position):
+            a.flags.writeable = False
+        self._node_index = (nodes, starts, position)
+
+
     @classmethod
-    def from_array(cls, array: np.array) -> Self:
+    def from_array(cls, array: np.array, repair: bool = False, rng: RNGLike = None) -> Self:
         '''
         Create a Map object from a 2D array.
 
         Args:
             array (np.array): A 2D array representing the map. 0 means the cell is
                             crossable, 1 means it is an obstacle.
+            repair (bool, optional): Whether to turn the crossable cells that are not
+                                     connected to the largest component into obstacles.
+                                     Defaults to False.
+            rng (RNGLike, optional): The random source of the map. Defaults to None.
 
         Returns:
             Map: A Map object.
         '''
         width = array.shape[1]
         height = array.shape[0]
-        obstacles_perc = int(np.floor(100 * np.sum(array) / (width * height)))
-        return cls(width, height, obstacles_perc, array)
+        obstacles_perc = obstacles_percentage(int(np.count_nonzero(array)), width, height)
+        map = cls(width, height, obstacles_perc, array, rng=rng)
+        if repair:
+            map.repair()
+        return map
+
+
+    @classmethod
+    def from_seed(cls, entropy: int, width: int, height: int, obstacles_perc: int, index: int, **kwargs) -> Self:
+        '''
+        Create the index-th map of a dataset from its seed, see map_seed. The map
+        keeps drawing from the same stream, so the sources and targets selected
+        afterwards are reproducible too.
+
+        Args:
+            entropy (int): The root entropy of the dataset.
+            width (int): The width of the map.
+            height (int): The height of the map.
+            obstacles_perc (int): The percentage of obstacles in the map.
+            index (int): The index of the map.
+            **kwargs: The other arguments of the constructor, such as jump_perc.
+
+        Returns:
+            Map: A Map object.
+        '''
+        rng = np.random.default_rng(map_seed(entropy, width, height, obstacles_perc, index))
+        return cls(width, height, obstacles_perc, rng=rng, **kwargs)
     
 
     def check_values(self):
@@ -75,70 +1157,52 @@ class Map:
             raise ValueError("Jump percentage must be between 0 and 100.")
         if self.array is not None and (self.array.shape[0] != self.height or self.array.shape[1] != self.width):
             raise ValueError("Array dimensions must match the width and height.")
-        if int(np.sum(self.array.flatten())) != int(np.ceil(self.width*self.height*self.obstacles_perc/100)):
-            raise ValueError(f"Obstacles percentage must match the array. Expected {np.sum(self.array.flatten())} but got {int(np.ceil(self.width*self.height*self.obstacles_perc/100))}")
+        if self.array is not None and self.obstacles_perc != obstacles_percentage(self._n_obstacles, self.width, self.height) \
+                and self._n_obstacles != obstacles_count(self.width, self.height, self.obstacles_perc):
+            raise ValueError(f"Obstacles percentage must match the array. Expected {obstacles_count(self.width, self.height, self.obstacles_perc)} obstacles but got {self._n_obstacles}")
     
 
     def generate_graph(self) -> None:
         '''
         Generates the graph representing the map and stores it in the attribute g.
         The graph is a grid graph with width x height nodes and edges connecting
-        each node to its 4 neighbors.
+        each node to its 4 neighbors. The crossable attribute of each node is set
+        from the attribute array.
 
         Returns:
             None
         '''
-
-        edges = []
-        for i in range(self.height):
-            for j in range(self.width):
-                node_id = i * self.width + j
-                if i != 0:
-                    edges.append((node_id, node_id - self.width))
-                if j != 0:
-                    edges.append((node_id, node_id - 1))
-        self.g = Graph(edges=edges, directed=False)
+        from igraph import Graph
+        nodes = np.arange(self.width * self.height).reshape(self.height, self.width)
+        up = np.stack([nodes[1:, :].flatten(), nodes[:-1, :].flatten()], axis=1)
+        left = np.stack([nodes[:, 1:].flatten(), nodes[:, :-1].flatten()], axis=1)
+        edges = np.concatenate([up, left])
+        edges = edges[np.argsort(edges[:, 0], kind='stable')]
+        self._g = Graph(n=self.width * self.height, edges=edges.tolist(), directed=False)
+        if self.array is not None:
+            self._g.vs['crossable'] = (self.array.flatten() == 0).tolist()
 
 
     def create_obstacles(self) -> None:
         '''
-        Creates the obstacles in the map. The obstacles are created by traversing
-        the graph and marking some nodes as valid. The percentage of obstacles
-        is given by the attribute obstacles_perc. The percentage of random jumps
-        while traversing the graph is given by the attribute jump_perc. The attribute
-        shuffle_edges determines whether the edges are shuffled while traversing the
-        graph. The method stores the crossable attribute in each node of the graph in 
-        the class attribute g.
-        '''
-        count = 0
-        source = np.random.choice(range(0, self.g.vcount()), 1, replace=False)
-        available_nodes = source.tolist()
-        self.g.vs['crossable'] = False
-        
-        obs = int(np.ceil(self.g.vcount() * self.obstacles_perc / 100))
-        while count < self.g.vcount() - obs:
-            if np.random.rand() <= self.jump_perc/100:
-                current_node = np.random.choice(available_nodes, 1)[0]
-            else:
-                current_node = available_nodes[-1]
-            self.g.vs[current_node]['crossable'] = True
-            available_nodes.remove(current_node)
-            count += 1
-            available_edegs = self.g.incident(current_node)
-            if self.shuffle_edges:
-                np.random.shuffle(available_edegs)
-            for e in available_edegs:
-                e = self.g.es[e]
-                new_node = e.target if e.source == current_node else e.source
-                if not self.g.vs[new_node]['crossable'] and new_node not in available_nodes:
-                    available_nodes.append(new_node)
+        Creates the obstacles in the map with the random walk of carve_obstacles.
+        The percentage of obstacles is given by the attribute obstacles_perc. The
+        percentage of random jumps while traversing the grid is given by the attribute
+        jump_perc. The attribute shuffle_edges determines whether the neighbours are
+        shuffled while traversing the grid, and legacy_carving whether the walk of the
+        original igraph implementation is used. The walk draws from the attribute rng.
+        The method stores the result in the attribute array and the crossable attribute
+        in each node of the graph g.
+        '''
+        self.array = carve_obstacles(self.width, self.height, self.obstacles_perc,
+                                     self.jump_perc, self.shuffle_edges, self.legacy_carving, self.rng)
 
 
     def init_obstacles(self, array: np.array = None) -> None:
         """
         Initializes the obstacles in the map. If array is None, it creates the obstacles
-        using the create_obstacles method. Otherwise, it sets the crossable attribute
-        of each node in the graph according to the array.
+        using the create_obstacles method. Otherwise, it stores array in the attribute
+        array. The graph is not touched until it is accessed.
 
         Args:
             array (np.array, optional): A 2D array representing the map. 0 means the cell is
@@ -150,50 +1214,95 @@ class Map:
         if array is None:
             self.create_obstacles()
         else:
-            for i in range(self.height):
-                for j in range(self.width):
-                    node_id = i * self.width + j
-                    self.g.vs[node_id]['crossable'] = array[i, j]
+            self.array = array
+
 
+    def pddl_static(self) -> str:
+        '''
+        Renders the sections of the PDDL problem that do not depend on the source
+        and the target: the header, the objects and the adjacency facts of the init.
+        The result is cached until the array of the map changes.
 
-    def to_pddl(self, source_target: Tuple[int, int]) -> str:
+        Returns:
+            str: The PDDL problem up to the position of the agent in the init.
+        '''
+        if self._pddl_static is not None:
+            return self._pddl_static
+        indent = '    '
+        w = self.width
+        free = self.array == 0
+        nodes = np.arange(self.width * self.height).reshape(self.height, self.width)
+        up_nodes = nodes[1:, :][free[1:, :] & free[:-1, :]]
+        left_nodes = nodes[:, 1:][free[:, 1:] & free[:, :-1]]
+        # Even keys are vertical pairs, odd keys horizontal ones: sorting them
+        # lists the facts cell by cell, up before left.
+        keys = np.sort(np.concatenate([2 * up_nodes, 2 * left_nodes + 1]))
+        facts = [
+            f'{indent}(is_left c{n-1} c{n})\n{indent}(is_right c{n} c{n-1})\n' if k & 1 else
+            f'{indent}(is_up c{n-w} c{n})\n{indent}(is_down c{n} c{n-w})\n'
+            for k, n in zip(keys.tolist(), (keys >> 1).tolist())
+        ]
+        objects = ' '.join(f'c{n}' for n in range(self.width * self.height))
+        self._pddl_static = ''.join([
+            '(define (problem p01) (:domain map)\n\n',
+            f'(:objects\n{indent}{objects} - cell\n',
+            f'{indent}a - agent\n',
+            ')\n\n\n',
+            '(:init\n',
+            *facts,
+        ])
+        return self._pddl_static
+
+
+    def pddl_chunks(self, source_target: Tuple[int, int], annotate: bool = False) -> Iterator[str]:
+        '''
+        Yields the PDDL problem in chunks.
+
+        Args:
+            source_target (Tuple[int, int]): Tuple with the source and target
+            annotate (bool, optional): Whether to start the problem with a comment
+                                       holding the optimal plan length, -1 if the
+                                       target is not reachable. Defaults to False.
+
+        Yields:
+            str: Consecutive pieces of the PDDL file.
+        '''
+        source, target = source_target
+        indent = '    '
+        if annotate:
+            yield f'; optimal plan length: {self.distances([source])[0, target]}\n'
+        yield self.pddl_static()
+        yield f'{indent}(in a c{source})\n)\n\n\n'
+        yield f'(:goal (and\n{indent}(in a c{target})\n))\n)'
+
+
+    def to_pddl(self, source_target: Tuple[int, int], annotate: bool = False) -> str:
         '''
         Converts the map to a PDDL file.
 
         Args:
             source_target (Tuple[int, int]): Tuple with the source and target
+            annotate (bool, optional): Whether to add the optimal plan length as a
+                                       comment. Defaults to False.
 
         Returns:
             str: The PDDL file as a string.
         '''
-        source, target = source_target
-        indent = '    '
-        s = '(define (problem p01) (:domain map)\n\n'
-        s += f'(:objects\n{indent}'
-        for i in range(self.height):
-            for j in range(self.width):
-                s += f'c{i*self.width+j} '
-        s += '- cell\n'
-        s += f'{indent}a - agent\n'
-        s += ')\n\n\n'
-        s += '(:init\n'
-        for i in range(self.height):
-            for j in range(self.width):
-                if i > 0:
-                    if self.array[i, j] == 0 and self.array[i-1, j] == 0:
-                        s += f'{indent}(is_up c{(i-1)*self.width+j} c{i*self.width+j})\n'
-                        s += f'{indent}(is_down c{i*self.width+j} c{(i-1)*self.width+j})\n'
-                if j > 0:
-                    if self.array[i, j] == 0 and self.array[i, j-1] == 0:
-                        s += f'{indent}(is_left c{i*self.width+j-1} c{i*self.width+j})\n'
-                        s += f'{indent}(is_right c{i*self.width+j} c{i*self.width+j-1})\n'
-        s += f'{indent}(in a c{source})\n'
-        s += f')\n\n\n'
-        s += '(:goal (and\n'
-        s += f'{indent}(in a c{target})\n'
-        s += '))\n'
-        s += ')'
-        return s
+        return ''.join(self.pddl_chunks(source_target, annotate))
+
+
+    def write_pddl(self, fileobj: IO[str], source_target: Tuple[int, int], annotate: bool = False) -> None:
+        '''
+        Writes the map as a PDDL file to an open text file, chunk by chunk.
+
+        Args:
+            fileobj (IO[str]): The file to write to.
+            source_target (Tuple[int, int]): Tuple with the source and target
+            annotate (bool, optional): Whether to add the optimal plan length as a
+                                       comment. Defaults to False.
+        '''
+        for chunk in self.pddl_chunks(source_target, annotate):
+            fileobj.write(chunk)
 
     
     def __str__(self) -> str:
@@ -206,56 +1315,234 @@ class Map:
         return f'{self.array}'
     
 
-    def select_source_target(self, source: int = None, target: int = None) -> Tuple[int, int]:
+    def distances(self, sources: List[int] = None) -> np.ndarray:
+        """
+        Returns the shortest path distances from the given sources, computed with
+        bfs_distances. The rows are cached, so sources already seen are not
+        searched again until the array of the map changes.
+
+        Args:
+            sources (List[int], optional): The source nodes. Defaults to all the nodes
+                                           of the map.
+
+        Returns:
+            np.ndarray: A (len(sources), cells) int16 or int32 array with the distance
+                        of each node from each source, -1 if it is not reachable.
+        """
+        if sources is None:
+            sources = range(self.width * self.height)
+        sources = [int(source) for source in sources]
+        missing = list(dict.fromkeys(source for source in sources if source not in self._distances))
+        if missing:
+            self._distances.update(zip(missing, bfs_distances(self.array, missing)))
+        if not sources:
+            return np.empty((0, self.width * self.height), dtype=np.int16)
+        return np.stack([self._distances[source] for source in sources])
+
+
+    def stats(self) -> Dict[str, Union[float, int, List[int]]]:
+        '''
+        Computes the statistics of the map, see map_stats.
+
+        Returns:
+            Dict[str, Union[float, int, List[int]]]: The statistics of the map.
+        '''
+        return {name: value[0].tolist() for name, value in map_stats(self.array[None]).items()}
+
+
+    def variant(self, k: int) -> Self:
+        '''
+        Returns the k-th rotation or reflection of the map, see dihedral_array,
+        without creating the obstacles again. Its PDDL problems are the ones of
+        this map with the nodes remapped by variant_nodes, and have the same
+        optimal plan lengths.
+
+        Args:
+            k (int): The variant, from 0 to 7. 0 is a copy of the map.
+
+        Returns:
+            Map: A new Map, sharing the random source of this one.
+        '''
+        array = dihedral_array(self.array, k).copy()
+        return type(self)(array.shape[1], array.shape[0], self.obstacles_perc, array,
+                          self.jump_perc, self.shuffle_edges, self.legacy_carving, self.rng)
+
+
+    def variants(self) -> Iterator[Self]:
+        '''
+        Yields the 8 rotations and reflections of the map, see variant. Some of
+        them are equal if the map is symmetric.
+
+        Yields:
+            Map: The variants, from 0 to 7.
+        '''
+        for k in range(8):
+            yield self.variant(k)
+
+
+    def variant_nodes(self, nodes: Union[int, Tuple[int, int], np.ndarray], k: int) -> Union[int, Tuple[int, int], np.ndarray]:
+        '''
+        Maps nodes of this map, such as a source and a target, to the same cells
+        of its k-th variant.
+
+        Args:
+            nodes (Union[int, Tuple[int, int], np.ndarray]): A node, a (source, target)
+                                                             tuple or an array of nodes.
+            k (int): The variant, from 0 to 7.
+
+        Returns:
+            Union[int, Tuple[int, int], np.ndarray]: The nodes in the variant, in
+                the same form.
+        '''
+        if isinstance(nodes, tuple):
+            return tuple(int(node) for node in dihedral_nodes(np.array(nodes), self.width, self.height, k))
+        if isinstance(nodes, np.ndarray):
+            return dihedral_nodes(nodes, self.width, self.height, k)
+        return int(dihedral_nodes(nodes, self.width, self.height, k))
+
+
+    def select_source_target(self, source: int = None, target: int = None, rng: RNGLike = None) -> Tuple[int, int]:
         """
         Selects the source and target nodes for the map. If source and target are None,
-        it selects two random crossable nodes. If source is not None, it selects a random
-        crossable node for the target. If target is not None, it selects a random crossable
-        node for the source.
+        it selects two random crossable nodes of the largest component. If source is not None, it selects a random
+        crossable node for the target in the component of source. If target is not None, it selects a random crossable
+        node for the source in the component of target. Each draw takes O(1) on the cached node_index.
 
         Args:
             source (int, optional): The source node. Defaults to None.
             target (int, optional): The target node. Defaults to None.
+            rng (RNGLike, optional): The random source. Defaults to None, which uses
+                                     the attribute rng.
 
         Raises:
-            ValueError: If the source or target nodes are not crossable.
+            ValueError: If the source or target nodes are not crossable, or no other
+                        node can be reached from them.
 
         Returns:
             Tuple[int, int]: The source and target nodes.
         """
-        valid_nodes = [i for i in range(self.g.vcount()) if self.g.vs[i]['crossable']]
-        if source is None and target is None:
-            (source, target) = np.random.choice(valid_nodes, 2, replace=False)
-        elif source is not None:
-            if source not in valid_nodes:
-                raise ValueError(f'The source node {source} is not crossable.')
-            target = np.random.choice(valid_nodes - {source}, 1)[0]
-        elif target is not None:
-            if target not in valid_nodes:
-                raise ValueError(f'The target node {target} is not crossable.')
-            source = np.random.choice(valid_nodes - {target}, 1)[0]
-        return source, target
+        rng = get_rng(self.rng if rng is None else rng)
+        nodes, starts, position = self.node_index()
+        for name, node in (('source', source), ('target', target)):
+            if node is not None and not (0 <= node < len(position) and position[node] >= 0):
+                raise ValueError(f'The {name} node {node} is not crossable.')
+        if source is not None and target is not None:
+            return source, target
+        given = source if source is not None else target
+        component = self.component_nodes(given)
+        m = len(component)
+        if m < 2:
+            raise ValueError(f'No other node can be reached from node {given}.' if given is not None else 'The map has fewer than 2 connected crossable nodes.')
+        if given is None:
+            i = int(_integers(rng, m))
+            source = int(component[i])
+        else:
+            i = int(position[given] - starts[self.components.flat[given]])
+        j = int(_integers(rng, m - 1))
+        other = int(component[j + (j >= i)])
+        if target is None:
+            return int(source), other
+        return other, int(target)
     
 
-    def select_sources_targets(self, n: int) -> List[Tuple[int, int]]:
+    def select_sources_targets(self, n: int, unique: bool = True, min_distance: int = None, stratify: bool = False,
+                               rng: RNGLike = None) -> List[Tuple[int, int]]:
         """
-        Selects n pairs of source and target nodes for the map.
+        Selects n pairs of source and target nodes for the map. The pairs are drawn
+        as indices in the m*(m-1) ordered pairs of the m crossable nodes, without
+        enumerating them, so the cost depends on n and not on the size of the map.
+        Only the nodes of the largest connected component are used, so every pair
+        has a path.
 
         Args:
             n (int): The number of pairs to select.
+            unique (bool, optional): Whether the pairs must be distinct. If n is larger
+                                     than the number of possible pairs, all of them are
+                                     returned. Defaults to True.
+            min_distance (int, optional): The minimum shortest path distance between
+                                          source and target. Pairs that are closer
+                                          are rejected. If not
+                                          enough pairs are found, the ones found are
+                                          returned. Defaults to None.
+            stratify (bool, optional): Whether to spread the pairs evenly over the path
+                                       lengths: for a random source, the distance of the
+                                       target is drawn uniformly among the distances
+                                       reachable from it, then the target among the
+                                       nodes at that distance. Defaults to False.
+            rng (RNGLike, optional): The random source. Defaults to None, which uses
+                                     the attribute rng.
 
         Returns:
             List[Tuple[int, int]]: A list of n pairs of source and target nodes.
         """
-        tuples = []
-        valid_nodes = [i for i in range(self.g.vcount()) if self.g.vs[i]['crossable']]
-        for i in range(len(valid_nodes)):
-            for j in range(len(valid_nodes)):
-                if i != j:
-                    tuples.append((valid_nodes[i], valid_nodes[j]))
-        if n > len(tuples):
-            print(f'The number of possible pairs is {len(tuples)}. Returning all of them.')
-            return tuples
-        
-        selected = np.random.choice(range(len(tuples)), n, replace=False)
-        return [tuples[i] for i in selected]
\ No newline at end of file
+        rng = get_rng(self.rng if rng is None else rng)
+        valid_nodes = self.component_nodes()
+        m = len(valid_nodes)
+        n_pairs = m * (m - 1)
+        constrained = min_distance is not None or stratify
+        if unique and not constrained and n > n_pairs:
+            print(f'The number of possible pairs is {n_pairs}. Returning all of them.')
+            selected = np.arange(n_pairs)
+        elif unique and not constrained and 2 * n > n_pairs:
+            selected = rng.choice(n_pairs, n, replace=False)
+        else:
+            selected = []
+            seen = set()
+            draws = 0
+            while len(selected) < n and n_pairs > 0 and draws < 1000 * n and len(seen) < n_pairs:
+                if stratify:
+                    batch = self._stratified_pairs(valid_nodes, n - len(selected), min_distance, rng)
+                else:
+                    batch = _integers(rng, n_pairs, size=n - len(selected))
+                    if min_distance is not None:
+                        self.distances(valid_nodes[np.unique(batch // (m - 1))])
+                draws += n - len(selected)
+                for p in batch.tolist():
+                    if unique:
+                        if p in seen:
+                            continue
+                        seen.add(p)
+                    if min_distance is not None:
+                        i, j = divmod(p, m - 1)
+                        source, target = valid_nodes[i], valid_nodes[j + (j >= i)]
+                        if not min_distance <= self._distances[int(source)][target]:
+                            continue
+                    selected.append(p)
+                    if len(selected) == n:
+                        break
+            if len(selected) < n:
+                print(f'Only {len(selected)} pairs satisfy the constraints. Returning them.')
+            selected = np.array(selected, dtype=np.int64)
+        i, j = np.divmod(selected, max(m - 1, 1))
+        j += j >= i
+        return list(zip(valid_nodes[i].tolist(), valid_nodes[j].tolist()))
+
+
+    def _stratified_pairs(self, valid_nodes: np.ndarray, k: int, min_distance: int,
+                          rng: Union[np.random.Generator, np.random.RandomState]) -> np.ndarray:
+        """
+        Draws k pair indices stratified by path length, see select_sources_targets.
+        Sources with no target far enough are skipped, so fewer than k indices
+        may be returned.
+
+        Args:
+            valid_nodes (np.ndarray): The crossable nodes, sorted.
+            k (int): The number of pairs to draw.
+            min_distance (int): The minimum path length, or None.
+            rng (Union[np.random.Generator, np.random.RandomState]): The random source.
+
+        Returns:
+            np.ndarray: Indices in the m*(m-1) ordered pairs of valid_nodes.
+        """
+        m = len(valid_nodes)
+        sources = _integers(rng, m, size=k)
+        rows = self.distances(valid_nodes[sources])
+        pairs = []
+        for i, row in zip(sources.tolist(), rows):
+            levels = np.unique(row[row >= max(1, min_distance or 1)])
+            if len(levels) == 0:
+                continue
+            target = rng.choice(np.flatnonzero(row == rng.choice(levels)))
+            j = int(np.searchsorted(valid_nodes, target))
+            pairs.append(i * (m - 1) + j - (j > i))
+        return np.array(pairs, dtype=np.int64)
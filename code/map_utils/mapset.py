@@ -0,0 +1,302 @@
+import json
+import os
+import numpy as np
+from typing import Iterator, List, Tuple, Union
+from map_utils.map import Map, dihedral_array, dihedral_nodes
+
+__all__ = ['PROBLEM_DTYPE', 'save_map_set', 'iter_json_maps', 'read_json_maps', 'convert_json_maps',
+           'MapSet', 'DihedralView']
+
+
+PROBLEM_DTYPE = np.dtype([('problem', np.int64), ('map', np.int64), ('source', np.int32), ('target', np.int32)])
+
+
+def save_map_set(path: Union[str, os.PathLike], arrays: np.ndarray, problems: np.ndarray, packed: bool = False) -> None:
+    '''
+    Saves a set of maps in binary form. path is a directory holding:
+        grids.npy: the maps as one contiguous uint8 array, either (N, H, W) or,
+                   if packed, (N, ceil(H*W/8)) with one bit per cell.
+        problems.npy: the problems table, a structured array with fields
+                      problem (index of the problem, p000123 -> 123), map (index
+                      of the map in grids), source and target, sorted by map.
+        meta.json: the shape of the maps and the packed flag.
+
+    Args:
+        path (Union[str, os.PathLike]): The directory of the map set. It is created
+                                        if it does not exist.
+        arrays (np.ndarray): A (N, H, W) array with the maps.
+        problems (np.ndarray): An array with PROBLEM_DTYPE, or a (M, 4) array with
+                               problem, map, source and target columns.
+        packed (bool, optional): Whether to store one bit per cell. Packed grids
+                                 are 8 times smaller but are unpacked on access
+                                 instead of being viewed in place. Defaults to False.
+    '''
+    arrays = np.asarray(arrays, dtype=np.uint8)
+    n, height, width = arrays.shape
+    problems = np.asarray(problems)
+    if problems.dtype != PROBLEM_DTYPE:
+        problems = np.asarray(problems, dtype=np.int64).reshape(-1, 4)
+        table = np.empty(len(problems), dtype=PROBLEM_DTYPE)
+        for k, name in enumerate(PROBLEM_DTYPE.names):
+            table[name] = problems[:, k]
+        problems = table
+    problems = problems[np.argsort(problems['map'], kind='stable')]
+    os.makedirs(path, exist_ok=True)
+    grids = np.packbits(arrays.reshape(n, -1), axis=1) if packed else arrays
+    np.save(os.path.join(path, 'grids.npy'), grids)
+    np.save(os.path.join(path, 'problems.npy'), problems)
+    _write_meta(path, n, height, width, packed)
+
+
+def _write_meta(path: Union[str, os.PathLike], n: int, height: int, width: int, packed: bool) -> None:
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'count': n, 'height': height, 'width': width, 'packed': packed}, f)
+
+
+def iter_json_maps(json_file: Union[str, os.PathLike]) -> Iterator[Tuple[np.ndarray, List[Tuple[int, int, int]]]]:
+    '''
+    Streams the maps of a maps JSONL file written by create_dataset.py, in either
+    the default or the compact layout of MapsWriter, one line at a time. In the
+    default layout, consecutive problems with the same grid belong to the same
+    map; in the compact layout, the problems of a map follow it.
+
+    Args:
+        json_file (Union[str, os.PathLike]): The path of the JSONL file.
+
+    Yields:
+        Tuple[np.ndarray, List[Tuple[int, int, int]]]: The uint8 array of each map
+            and the (problem, source, target) rows of its problems.
+    '''
+    grid, raw, map_id, problems = None, None, None, []
+    with open(json_file) as f:
+        for line in f:
+            record = json.loads(line)
+            if 'problem' not in record or ('map_id' not in record and record['map'] != raw):
+                if grid is not None:
+                    yield grid, problems
+                raw, map_id = record['map'], record.get('map_id')
+                grid, problems = np.array(raw, dtype=np.uint8), []
+            elif 'map_id' in record and record['map_id'] != map_id:
+                raise ValueError(f'Problem {record["problem"]} in {json_file} does not follow its map {record["map_id"]}.')
+            if 'problem' in record:
+                source, target = record['source_destination']
+                problems.append((int(record['problem'][1:]), source, target))
+    if grid is not None:
+        yield grid, problems
+
+
+def read_json_maps(json_file: Union[str, os.PathLike]) -> Tuple[List[List[List[int]]], List[Tuple[int, int, int, int]]]:
+    '''
+    Reads a maps JSONL file written by create_dataset.py, in either the default
+    or the compact layout of MapsWriter. In the default layout, consecutive
+    problems with the same grid belong to the same map.
+
+    Args:
+        json_file (Union[str, os.PathLike]): The path of the JSONL file.
+
+    Returns:
+        Tuple[List[List[List[int]]], List[Tuple[int, int, int, int]]]: The grids
+            of the maps and the (problem, map, source, target) rows of the problems.
+    '''
+    grids = []
+    problems = []
+    for map_index, (grid, rows) in enumerate(iter_json_maps(json_file)):
+        grids.append(grid.tolist())
+        problems.extend((problem, map_index, source, target) for problem, source, target in rows)
+    return grids, problems
+
+
+def convert_json_maps(json_file: Union[str, os.PathLike], path: Union[str, os.PathLike], packed: bool = False) -> None:
+    '''
+    Converts a maps_{row}x{row}_{perc}.json file to a binary map set. The file
+    is streamed twice with iter_json_maps: once to count the maps and problems,
+    then to fill memory-mapped .npy files, so only one map is held in memory.
+
+    Args:
+        json_file (Union[str, os.PathLike]): The path of the JSONL file.
+        path (Union[str, os.PathLike]): The directory of the map set.
+        packed (bool, optional): Whether to store one bit per cell. Defaults to False.
+    '''
+    n, n_problems, shape = 0, 0, (0, 0)
+    for grid, rows in iter_json_maps(json_file):
+        n, n_problems, shape = n + 1, n_problems + len(rows), grid.shape
+    height, width = shape
+    os.makedirs(path, exist_ok=True)
+    grids_shape = (n, (height * width + 7) // 8) if packed else (n, height, width)
+    grids = np.lib.format.open_memmap(os.path.join(path, 'grids.npy'), mode='w+', dtype=np.uint8, shape=grids_shape)
+    problems = np.lib.format.open_memmap(os.path.join(path, 'problems.npy'), mode='w+', dtype=PROBLEM_DTYPE, shape=(n_problems,))
+    start = 0
+    for i, (grid, rows) in enumerate(iter_json_maps(json_file)):
+        if grid.shape != shape:
+            raise ValueError(f'Map {i} of {json_file} is {grid.shape[0]}x{grid.shape[1]}, not {height}x{width}.')
+        grids[i] = np.packbits(grid.ravel()) if packed else grid
+        if rows:
+            block = problems[start:start + len(rows)]
+            columns = np.array(rows, dtype=np.int64)
+            block['problem'], block['map'], block['source'], block['target'] = columns[:, 0], i, columns[:, 1], columns[:, 2]
+        start += len(rows)
+    grids.flush()
+    problems.flush()
+    del grids, problems
+    _write_meta(path, n, height, width, packed)
+
+
+class MapSet:
+    '''
+    A map set saved by save_map_set, loaded with memory mapping. Maps are read
+    from disk only when they are accessed.
+
+    Attributes:
+        path (Union[str, os.PathLike]): The directory of the map set.
+        width (int): The width of the maps.
+        height (int): The height of the maps.
+        packed (bool): Whether the grids are stored with one bit per cell.
+        grids (np.memmap): The stored grids.
+        problems (np.memmap): The problems table, see PROBLEM_DTYPE.
+    '''
+
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.width = meta['width']
+        self.height = meta['height']
+        self.packed = meta['packed']
+        self.grids = np.load(os.path.join(path, 'grids.npy'), mmap_mode='r')
+        self.problems = np.load(os.path.join(path, 'problems.npy'), mmap_mode='r')
+
+
+    def __len__(self) -> int:
+        return len(self.grids)
+
+
+    def __iter__(self) -> Iterator[Map]:
+        for i in range(len(self)):
+            yield self.map(i)
+
+
+    def array(self, i: int) -> np.ndarray:
+        '''
+        Returns the array of the i-th map. If the set is not packed, this is a
+        read-only view on the memory-mapped file.
+
+        Args:
+            i (int): The index of the map.
+
+        Returns:
+            np.ndarray: A (height, width) uint8 array.
+        '''
+        if self.packed:
+            return np.unpackbits(self.grids[i], count=self.height * self.width).reshape(self.height, self.width)
+        return self.grids[i]
+
+
+    def map(self, i: int) -> Map:
+        '''
+        Returns the i-th map.
+
+        Args:
+            i (int): The index of the map.
+
+        Returns:
+            Map: A Map object built on the array of the map.
+        '''
+        return Map.from_array(self.array(i))
+
+
+    def map_problems(self, i: int) -> np.ndarray:
+        '''
+        Returns the problems of the i-th map.
+
+        Args:
+            i (int): The index of the map.
+
+        Returns:
+            np.ndarray: The rows of the problems table of the map.
+        '''
+        start, end = np.searchsorted(self.problems['map'], [i, i + 1])
+        return self.problems[start:end]
+
+
+    def variants(self) -> 'DihedralView':
+        '''
+        Returns the 8 rotations and reflections of every map of the set, see
+        DihedralView. The grids must not be packed.
+
+        Returns:
+            DihedralView: The view over the grids and problems of the set.
+        '''
+        if self.packed:
+            raise ValueError('Variants can only be viewed on a map set that is not packed.')
+        return DihedralView(self.grids, self.problems)
+
+
+class DihedralView:
+    '''
+    The 8 rotations and reflections of a batch of maps, see dihedral_array,
+    computed on access as views of the stored arrays, so the augmented set
+    takes no more memory or disk than the original one. Item j is variant
+    j % 8 of map j // 8.
+
+    Attributes:
+        grids (np.ndarray): The (N, H, W) stored maps, e.g. MapSet.grids.
+        problems (np.ndarray): The problems table of the maps, see PROBLEM_DTYPE.
+                               Default is None.
+    '''
+
+    def __init__(self, grids: np.ndarray, problems: np.ndarray = None) -> None:
+        self.grids = grids
+        self.problems = problems
+
+
+    def __len__(self) -> int:
+        return 8 * len(self.grids)
+
+
+    def __getitem__(self, j: int) -> np.ndarray:
+        return dihedral_array(self.grids[j // 8], j % 8)
+
+
+    def map(self, j: int) -> Map:
+        '''
+        Returns the j-th map of the view.
+
+        Args:
+            j (int): The index of the map in the view.
+
+        Returns:
+            Map: A Map object built on a copy of the array of the variant.
+        '''
+        return Map.from_array(np.ascontiguousarray(self[j]))
+
+
+    def batch(self, k: int) -> np.ndarray:
+        '''
+        Returns the k-th variant of every map at once.
+
+        Args:
+            k (int): The variant, from 0 to 7.
+
+        Returns:
+            np.ndarray: A (N, H, W) view of the grids, or (N, W, H) for odd k.
+        '''
+        return dihedral_array(self.grids, k)
+
+
+    def batch_problems(self, k: int) -> np.ndarray:
+        '''
+        Returns the problems table with the sources and targets remapped to the
+        k-th variant of their maps.
+
+        Args:
+            k (int): The variant, from 0 to 7.
+
+        Returns:
+            np.ndarray: A new problems table, see PROBLEM_DTYPE.
+        '''
+        _, height, width = self.grids.shape
+        problems = np.array(self.problems)
+        for field in ('source', 'target'):
+            problems[field] = dihedral_nodes(problems[field], width, height, k)
+        return problems
+
@@ -0,0 +1,282 @@
+import glob
+import gzip
+import json
+import os
+import struct
+import tarfile
+import zipfile
+import zlib
+from typing import Iterator, List, Tuple, Union
+
+__all__ = ['ARCHIVE_FORMATS', 'compress_problems', 'PDDLArchiveWriter', 'PDDLArchive']
+
+
+ARCHIVE_FORMATS = ('zip', 'tar.gz')
+# The timestamp of every member, so rerunning a dataset gives the same bytes:
+# 1980-01-01 00:00:00 in MS-DOS format for zip, the epoch for tar.
+_ZIP_DATE, _ZIP_TIME = (1 << 5) | 1, 0
+# The largest zip shard without the zip64 extensions.
+_ZIP_MAX_ENTRIES, _ZIP_MAX_SIZE = 0xFFFF, 0xFFFFFFFF
+
+
+def compress_problems(texts: List[Tuple[str, str]], format: str = 'zip',
+                      compresslevel: int = 6) -> Tuple[List[Tuple[str, int, int, int, int]], bytes, int]:
+    '''
+    Compresses some problems, usually the ones of a map, into a block that
+    PDDLArchiveWriter.add_compressed appends to a shard as it is. Compression
+    is most of the cost of an archive, so this can run in the worker processes.
+    In a zip block every problem is a member, made of its local header and its
+    deflated PDDL. A tar.gz block is a gzip member holding the tar members of
+    the problems: gzip readers concatenate the members of a file, and the
+    problems of a map compress much better together than alone.
+
+    Args:
+        texts (List[Tuple[str, str]]): The name and PDDL of each problem.
+        format (str, optional): zip or tar.gz. Defaults to zip.
+        compresslevel (int, optional): The zlib compression level, from 0 to 9.
+                                       Defaults to 6.
+
+    Returns:
+        Tuple[List[Tuple[str, int, int, int, int]], bytes, int]: The name, offset,
+            size, compressed size and CRC-32 of each problem, the offsets relative to
+            the block and the last two None for tar.gz, the block and its length
+            in the offsets of the shard: the bytes of the file for zip, the ones
+            of the uncompressed tar stream for tar.gz.
+    '''
+    if format not in ARCHIVE_FORMATS:
+        raise ValueError(f'Unknown archive format {format}. Use one of {", ".join(ARCHIVE_FORMATS)}.')
+    entries = []
+    chunks = []
+    offset = 0
+    for problem, text in texts:
+        data = text.encode()
+        member = f'{problem}.pddl'
+        if format == 'zip':
+            name = member.encode()
+            crc = zlib.crc32(data)
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+            deflated = compressor.compress(data) + compressor.flush()
+            header = struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, 0, zipfile.ZIP_DEFLATED, _ZIP_TIME, _ZIP_DATE,
+                                 crc, len(deflated), len(data), len(name), 0)
+            chunks += [header, name, deflated]
+            entries.append((problem, offset, len(data), len(deflated), crc))
+            offset += len(header) + len(name) + len(deflated)
+        else:
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            info.mtime = 0
+            header = info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+            padding = -len(data) % tarfile.BLOCKSIZE
+            chunks += [header, data, bytes(padding)]
+            entries.append((problem, offset + len(header), len(data), None, None))
+            offset += len(header) + len(data) + padding
+    block = b''.join(chunks)
+    if format == 'tar.gz':
+        block = gzip.compress(block, compresslevel, mtime=0)
+    return entries, block, offset
+
+
+class PDDLArchiveWriter:
+    '''
+    Writes PDDL problems into sharded compressed archives instead of one file per
+    problem. Shards are named {name}_{shard:04d}.zip (or .tar.gz) and hold about
+    shard_size problems: a shard is closed once it has shard_size problems, and
+    the problems added together are never split. When a shard is closed, a line
+    per problem is appended to the index {name}.index.jsonl:
+        {"problem": "p000000", "shard": "problems_0000.zip", "offset": 0, "size": 812, "compressed": 301}
+    offset is where the member starts in the shard: its local header for zip, its
+    data in the uncompressed tar stream for tar.gz. See PDDLArchive to read them.
+    The members and the gzip stream carry a fixed timestamp, so the same problems
+    added in the same order give the same bytes.
+
+    Attributes:
+        directory (Union[str, os.PathLike]): The directory of the shards and index.
+        name (str): The prefix of the shards and index.
+        shard_size (int): The number of problems per shard, at most 65535 for
+                          zip. Default is 10000.
+        format (str): zip, where every problem is compressed on its own and can be
+                      read with a single seek, or tar.gz, which compresses better
+                      but is decompressed from the start of the shard up to the
+                      problem. Default is zip.
+        shards (int): The number of the next shard.
+        compresslevel (int): The zlib compression level of add. Default is 6.
+    '''
+
+    def __init__(self, directory: Union[str, os.PathLike], name: str, shard_size: int = 10000,
+                 format: str = 'zip', start_shard: int = 0, compresslevel: int = 6) -> None:
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unknown archive format {format}. Use one of {", ".join(ARCHIVE_FORMATS)}.')
+        if format == 'zip' and shard_size > _ZIP_MAX_ENTRIES:
+            raise ValueError(f'A zip shard holds at most {_ZIP_MAX_ENTRIES} problems, got shard_size {shard_size}.')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.shard_size = shard_size
+        self.format = format
+        self.shards = start_shard
+        self.compresslevel = compresslevel
+        self.index_path = os.path.join(directory, f'{name}.index.jsonl')
+        self._file = None
+        self._position = 0
+        self._entries = []
+
+
+    def __enter__(self) -> 'PDDLArchiveWriter':
+        return self
+
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+    def add(self, problem: str, text: str) -> None:
+        '''
+        Compresses a problem and adds it to the current shard, opening a new shard
+        if needed.
+
+        Args:
+            problem (str): The name of the problem, e.g. p000123.
+            text (str): The PDDL of the problem, see Map.to_pddl.
+        '''
+        self.add_compressed(*compress_problems([(problem, text)], self.format, self.compresslevel))
+
+
+    def add_compressed(self, entries: List[Tuple[str, int, int, int, int]], block: bytes, length: int) -> None:
+        '''
+        Appends a block of compress_problems, of the format of the writer, to the
+        current shard, opening a new shard if needed.
+
+        Args:
+            entries (List[Tuple[str, int, int, int, int]]): The entries of the block.
+            block (bytes): The block.
+            length (int): The length of the block in the offsets of the shard.
+
+        Raises:
+            ValueError: If a zip shard would need the zip64 extensions.
+        '''
+        if self._file is None:
+            self._open_shard()
+        if self.format == 'zip' and self._position + length > _ZIP_MAX_SIZE:
+            raise ValueError(f'The zip shard {self._shard_name(self.shards)} would exceed 4 GiB, lower shard_size.')
+        self._file.write(block)
+        self._entries.extend((problem, self._position + offset, size, compressed, crc)
+                             for problem, offset, size, compressed, crc in entries)
+        self._position += length
+        if len(self._entries) >= self.shard_size:
+            self._close_shard()
+
+
+    def close(self) -> None:
+        '''
+        Closes the current shard and writes its index lines.
+        '''
+        if self._file is not None:
+            self._close_shard()
+
+
+    def _shard_name(self, shard: int) -> str:
+        return f'{self.name}_{shard :04d}.{self.format}'
+
+
+    def _open_shard(self) -> None:
+        self._file = open(os.path.join(self.directory, self._shard_name(self.shards)), 'wb')
+        self._position = 0
+
+
+    def _close_shard(self) -> None:
+        if self.format == 'zip':
+            # The central directory and its end record.
+            directory = []
+            for problem, offset, size, compressed, crc in self._entries:
+                name = f'{problem}.pddl'.encode()
+                directory += [struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 20, 20, 0, zipfile.ZIP_DEFLATED,
+                                          _ZIP_TIME, _ZIP_DATE, crc, compressed, size, len(name), 0, 0, 0, 0,
+                                          0o644 << 16, offset), name]
+            directory = b''.join(directory)
+            self._file.write(directory)
+            self._file.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(self._entries), len(self._entries),
+                                         len(directory), self._position, 0))
+        else:
+            # The end of the tar archive, two empty blocks padded to a full record.
+            end = 2 * tarfile.BLOCKSIZE
+            end += -(self._position + end) % tarfile.RECORDSIZE
+            self._file.write(gzip.compress(bytes(end), self.compresslevel, mtime=0))
+        self._file.close()
+        shard = self._shard_name(self.shards)
+        with open(self.index_path, 'a') as f:
+            f.writelines(json.dumps({'problem': problem, 'shard': shard, 'offset': offset, 'size': size, 'compressed': compressed}) + '\n'
+                         for problem, offset, size, compressed, _ in self._entries)
+        self._file = None
+        self._entries = []
+        self.shards += 1
+
+
+class PDDLArchive:
+    '''
+    Reads single problems from the archives written by PDDLArchiveWriter, using
+    the offsets of the index to avoid scanning or extracting the shards.
+
+    Attributes:
+        directory (Union[str, os.PathLike]): The directory of the shards and indices.
+        entries (Dict[str, Tuple[str, int, int, int]]): The shard, offset, size and
+            compressed size of each problem, read from every *.index.jsonl file
+            of the directory.
+    '''
+
+    def __init__(self, directory: Union[str, os.PathLike]) -> None:
+        self.directory = directory
+        self.entries = {}
+        for index_path in sorted(glob.glob(os.path.join(directory, '*.index.jsonl'))):
+            with open(index_path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.entries[record['problem']] = (record['shard'], record['offset'], record['size'], record['compressed'])
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def __contains__(self, problem: str) -> bool:
+        return problem in self.entries
+
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+
+    def read(self, problem: str) -> str:
+        '''
+        Reads a problem.
+
+        Args:
+            problem (str): The name of the problem.
+
+        Returns:
+            str: The PDDL of the problem.
+        '''
+        shard, offset, size, compressed = self.entries[problem]
+        path = os.path.join(self.directory, shard)
+        if shard.endswith('.zip'):
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                header = f.read(30)
+                name_length, extra_length = struct.unpack('<HH', header[26:30])
+                f.seek(name_length + extra_length, os.SEEK_CUR)
+                data = f.read(compressed)
+            return zlib.decompress(data, -zlib.MAX_WBITS).decode()
+        with gzip.open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(size).decode()
+
+
+    def extract(self, problem: str, path: Union[str, os.PathLike]) -> None:
+        '''
+        Writes a problem to a .pddl file, e.g. to pass it to a planner.
+
+        Args:
+            problem (str): The name of the problem.
+            path (Union[str, os.PathLike]): The path of the file.
+        '''
+        with open(path, 'w') as f:
+            f.write(self.read(problem))
@@ -1,17 +1,24 @@
-from typing import List, Union
+from typing import List, Sequence, Tuple, Union
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib import colors
+import matplotlib.image
 import os
 
 
-def plot_maps(maps_list: List[np.array], save_img_path: Union[str, None, os.PathLike] = None) -> None:
+# Codes of the cells of a tiled image, and their RGB colours.
+_FREE, _OBSTACLE, _SOURCE, _TARGET, _PADDING = range(5)
+_PALETTE = np.array([[255, 255, 255], [0, 0, 0], [0, 170, 0], [220, 0, 0], [128, 128, 128]], dtype=np.uint8)
+
+
+def plot_maps(maps_list: List[np.array], save_img_path: Union[str, None, os.PathLike] = None, show: bool = True) -> None:
     """
     Plot a list of maps.
 
     Args:
         maps_list (List[np.array]): List of maps to plot. Each map is a 2D numpy array.
         save_img_path (Union[str, None, os.PathLike], optional): Path to save the image. Defaults to None.
+        show (bool, optional): Whether to show the figure. Defaults to True.
     """
     rows = int(np.ceil(np.sqrt(len(maps_list))))
     fig, axs = plt.subplots(rows, rows, figsize=(20, 20))
@@ -27,18 +34,159 @@ def plot_maps(maps_list: List[np.array], save_img_path: Union[str, None, os.Path
     plt.tight_layout()
     if save_img_path is not None:
         fig.savefig(save_img_path)
-    plt.show()
+    if show:
+        plt.show()
     plt.close(fig)
 
 
 
-def plot_map(map: np.array, save_img_path : Union[str, None, os.PathLike] = None) -> None:
+def plot_map(map: np.array, save_img_path : Union[str, None, os.PathLike] = None, show: bool = True) -> None:
     """
     Plot a single map.
 
     Args:
         map (np.array): Map to plot. A 2D numpy array.
         save_img_path (Union[str, None, os.PathLike], optional): Path to save the image. Defaults to None.
+        show (bool, optional): Whether to show the figure. Defaults to True.
+    """
+
+    plot_maps([map], save_img_path, show)
+
+
+def map_codes(maps: Union[np.ndarray, Sequence[np.ndarray]], sources_targets: Sequence[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Stacks maps into one array of cell codes: 0 for crossable cells, 1 for
+    obstacles, 2 for sources, 3 for targets and 4 for the padding around the
+    maps smaller than the largest one.
+
+    Args:
+        maps (Union[np.ndarray, Sequence[np.ndarray]]): A (N, H, W) array or a list of 2D maps.
+        sources_targets (Sequence[Tuple[int, int]], optional): The source and target node
+            of each map, or None for the maps without overlay. Defaults to None.
+
+    Returns:
+        np.ndarray: A (N, H, W) uint8 array, with H and W the largest height and width.
+    """
+    if isinstance(maps, np.ndarray) and maps.ndim == 3:
+        codes = (maps != 0).astype(np.uint8)
+        widths = np.full(len(maps), maps.shape[2])
+    else:
+        height = max(m.shape[0] for m in maps)
+        width = max(m.shape[1] for m in maps)
+        codes = np.full((len(maps), height, width), _PADDING, dtype=np.uint8)
+        for i, m in enumerate(maps):
+            codes[i, :m.shape[0], :m.shape[1]] = np.asarray(m) != 0
+        widths = np.array([m.shape[1] for m in maps])
+    if sources_targets is not None:
+        index = np.array([i for i, st in enumerate(sources_targets) if st is not None], dtype=np.int64)
+        if len(index) > 0:
+            nodes = np.array([sources_targets[i] for i in index], dtype=np.int64)
+            for k, code in ((0, _SOURCE), (1, _TARGET)):
+                rows, cols = np.divmod(nodes[:, k], widths[index])
+                codes[index, rows, cols] = code
+    return codes
+
+
+def tile_maps(maps: Union[np.ndarray, Sequence[np.ndarray]], sources_targets: Sequence[Tuple[int, int]] = None,
+              columns: int = None, padding: int = 1, scale: int = 1) -> np.ndarray:
+    """
+    Tiles maps into a single RGB image, built with NumPy only: obstacles are black,
+    crossable cells white, sources green, targets red, and the maps are separated
+    by gray lines.
+
+    Args:
+        maps (Union[np.ndarray, Sequence[np.ndarray]]): A (N, H, W) array or a list of 2D maps.
+        sources_targets (Sequence[Tuple[int, int]], optional): The source and target node
+            of each map, or None for the maps without overlay. Defaults to None.
+        columns (int, optional): The number of maps per row. Defaults to None, which
+            makes the grid of maps square.
+        padding (int, optional): The width in pixels of the lines between the maps.
+            Defaults to 1.
+        scale (int, optional): The number of pixels per side of a cell. Defaults to 1.
+
+    Returns:
+        np.ndarray: A (rows, cols, 3) uint8 image.
+    """
+    codes = map_codes(maps, sources_targets)
+    n, height, width = codes.shape
+    columns = columns or int(np.ceil(np.sqrt(n)))
+    rows = int(np.ceil(n / columns))
+    codes = codes.repeat(scale, axis=1).repeat(scale, axis=2)
+    cell_height, cell_width = height * scale + padding, width * scale + padding
+    tiles = np.full((rows * columns, cell_height, cell_width), _PADDING, dtype=np.uint8)
+    tiles[:n, :height * scale, :width * scale] = codes
+    tiles = tiles.reshape(rows, columns, cell_height, cell_width).transpose(0, 2, 1, 3)
+    image = np.full((rows * cell_height + padding, columns * cell_width + padding), _PADDING, dtype=np.uint8)
+    image[padding:, padding:] = tiles.reshape(rows * cell_height, columns * cell_width)
+    return _PALETTE[image]
+
+
+def plot_tiles(maps: Union[np.ndarray, Sequence[np.ndarray]], sources_targets: Sequence[Tuple[int, int]] = None,
+               save_img_path: Union[str, None, os.PathLike] = None, columns: int = None, show: bool = True) -> None:
     """
+    Plot many maps at once, drawing the image of tile_maps with a single imshow.
 
-    plot_maps([map], save_img_path)
\ No newline at end of file
+    Args:
+        maps (Union[np.ndarray, Sequence[np.ndarray]]): A (N, H, W) array or a list of 2D maps.
+        sources_targets (Sequence[Tuple[int, int]], optional): The source and target node
+            of each map, or None for the maps without overlay. Defaults to None.
+        save_img_path (Union[str, None, os.PathLike], optional): Path to save the image. Defaults to None.
+        columns (int, optional): The number of maps per row. Defaults to None.
+        show (bool, optional): Whether to show the figure. Defaults to True.
+    """
+    image = tile_maps(maps, sources_targets, columns)
+    fig, ax = plt.subplots(figsize=(20, 20))
+    ax.imshow(image, interpolation='nearest')
+    ax.axis('off')
+    plt.tight_layout()
+    if save_img_path is not None:
+        fig.savefig(save_img_path)
+    if show:
+        plt.show()
+    plt.close(fig)
+
+
+def save_tiles(maps: Union[np.ndarray, Sequence[np.ndarray]], save_img_path: Union[str, os.PathLike],
+               sources_targets: Sequence[Tuple[int, int]] = None, columns: int = None, scale: int = 4) -> None:
+    """
+    Save the image of tile_maps as a PNG file, without creating a figure, so it
+    works with any matplotlib backend.
+
+    Args:
+        maps (Union[np.ndarray, Sequence[np.ndarray]]): A (N, H, W) array or a list of 2D maps.
+        save_img_path (Union[str, os.PathLike]): Path to save the image.
+        sources_targets (Sequence[Tuple[int, int]], optional): The source and target node
+            of each map, or None for the maps without overlay. Defaults to None.
+        columns (int, optional): The number of maps per row. Defaults to None.
+        scale (int, optional): The number of pixels per side of a cell. Defaults to 4.
+    """
+    matplotlib.image.imsave(save_img_path, tile_maps(maps, sources_targets, columns, scale=scale), format='png')
+
+
+def save_thumbnails(maps: Union[np.ndarray, Sequence[np.ndarray]], directory: Union[str, os.PathLike], names: Sequence[str] = None,
+                    sources_targets: Sequence[Tuple[int, int]] = None, scale: int = 4) -> List[str]:
+    """
+    Save one PNG thumbnail per map, without creating any figure.
+
+    Args:
+        maps (Union[np.ndarray, Sequence[np.ndarray]]): A (N, H, W) array or a list of 2D maps.
+        directory (Union[str, os.PathLike]): The directory of the thumbnails. It is created
+            if it does not exist.
+        names (Sequence[str], optional): The file name, without extension, of each map.
+            Defaults to None, which numbers the maps.
+        sources_targets (Sequence[Tuple[int, int]], optional): The source and target node
+            of each map, or None for the maps without overlay. Defaults to None.
+        scale (int, optional): The number of pixels per side of a cell. Defaults to 4.
+
+    Returns:
+        List[str]: The paths of the thumbnails.
+    """
+    os.makedirs(directory, exist_ok=True)
+    names = names if names is not None else [f'{i :06d}' for i in range(len(maps))]
+    images = _PALETTE[map_codes(maps, sources_targets).repeat(scale, axis=1).repeat(scale, axis=2)]
+    paths = []
+    for i, (name, m) in enumerate(zip(names, maps)):
+        path = os.path.join(directory, f'{name}.png')
+        matplotlib.image.imsave(path, images[i, :m.shape[0] * scale, :m.shape[1] * scale], format='png')
+        paths.append(path)
+    return paths
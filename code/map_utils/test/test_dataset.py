@@ -0,0 +1,72 @@
+from map_utils import Map, MapsWriter, DatasetCheckpoint, format_map_id, parse_map_id, iter_problems, layout_batches
+import numpy as np
+import json
+
+
+def test_maps_writer(tmp_path):
+    array = np.array([[0, 1], [0, 0]], dtype=np.uint8)
+    path = tmp_path / 'maps.json'
+    with MapsWriter(path, buffer_size=3) as writer:
+        writer.write_map('m000000', array, [('p000000', 0, 3), ('p000001', 3, 2)])
+        writer.write_map('m000001', array, [('p000002', 2, 0)])
+    lines = path.read_text().splitlines()
+    assert len(lines) == 3
+    assert lines[0] == json.dumps({'problem': 'p000000', 'map': array.tolist(), 'source_destination': (0, 3)})
+    assert json.loads(lines[2]) == {'problem': 'p000002', 'map': [[0, 1], [0, 0]], 'source_destination': [2, 0]}
+
+
+def test_maps_writer_compact(tmp_path):
+    array = np.array([[0, 1], [0, 0]], dtype=np.uint8)
+    path = tmp_path / 'maps.json'
+    with MapsWriter(path, compact=True) as writer:
+        writer.write_map('m000000', array, [('p000000', 0, 3), ('p000001', 3, 2)])
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert records == [
+        {'map_id': 'm000000', 'map': [[0, 1], [0, 0]]},
+        {'problem': 'p000000', 'map_id': 'm000000', 'source_destination': [0, 3]},
+        {'problem': 'p000001', 'map_id': 'm000000', 'source_destination': [3, 2]},
+    ]
+
+
+def test_dataset_checkpoint(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    checkpoint = DatasetCheckpoint(path, 7)
+    assert checkpoint.bucket('6x6_10') == {'maps': 0, 'json_size': 0, 'next_seed': 0, 'exhausted': False}
+    checkpoint.commit('6x6_10', 5, 1234, 6, False, 100)
+    loaded = DatasetCheckpoint.load(path)
+    assert loaded.entropy == 7
+    assert loaded.next_index == 100
+    assert loaded.bucket('6x6_10') == {'maps': 5, 'json_size': 1234, 'next_seed': 6, 'exhausted': False}
+    assert not (tmp_path / 'checkpoint.json.tmp').exists()
+
+
+def test_map_id():
+    map_id = format_map_id(8, 6, 30, 12)
+    assert map_id == 'm8x6_30_000012'
+    assert parse_map_id(map_id) == (8, 6, 30, 12)
+
+def test_layout_batches(tmp_path):
+    maps = [Map(4, 3, 25) for _ in range(5)]
+    json_files = [tmp_path / 'maps.json', tmp_path / 'maps_compact.json']
+    for compact, json_file in zip([False, True], json_files):
+        with MapsWriter(json_file, compact=compact) as writer:
+            for i, map in enumerate(maps):
+                writer.write_map(f'm{i :06d}', map.array, [(f'p{2 * i :06d}', 0, 11), (f'p{2 * i + 1 :06d}', 5, 6)])
+
+    for json_file in json_files:
+        problems = list(iter_problems([json_file]))
+        assert [p[0] for p in problems] == [f'p{i :06d}' for i in range(10)]
+        assert np.array_equal(problems[3][1], maps[1].array)
+
+    batches = list(layout_batches(json_files, 4))
+    assert [len(blocks) for blocks, _, _ in batches] == [4, 4, 4, 4, 4]
+    blocks, start_pos, goal_pos = batches[0]
+    assert blocks.shape == (4, 3, 4)
+    assert np.array_equal(blocks[2], maps[1].array)
+    assert start_pos.tolist() == [[0, 0], [1, 1], [0, 0], [1, 1]]
+    assert goal_pos.tolist() == [[2, 3], [1, 2], [2, 3], [1, 2]]
+
+    shuffled = list(layout_batches(json_files, 3, shuffle_buffer=5, seed=0))
+    assert sum(len(blocks) for blocks, _, _ in shuffled) == 20
+    starts = np.concatenate([start_pos for _, start_pos, _ in shuffled])
+    assert sorted(tuple(pos) for pos in starts.tolist()) == [(0, 0)] * 10 + [(1, 1)] * 10
@@ -0,0 +1,40 @@
+from map_utils import DedupIndex
+import numpy as np
+import pytest
+
+
+def test_dedup_index():
+    array = np.array([[0, 1, 1], [0, 0, 0], [0, 0, 0]])
+    index = DedupIndex()
+    assert index.add(array) == True
+    assert index.add(array.copy()) == False
+    assert index.add(np.rot90(array)) == True
+    assert array in index
+    assert len(index) == 2
+    assert index.attempts == 3
+    assert index.rejects == 1
+    assert index.reject_rate == pytest.approx(1 / 3)
+
+    index = DedupIndex(symmetric=True)
+    assert index.add(array) == True
+    for k in range(4):
+        assert index.add(np.rot90(array, k)) == False
+        assert index.add(np.rot90(np.fliplr(array), k)) == False
+    assert index.add(np.zeros((3, 3))) == True
+
+
+def test_dedup_index_persistence(tmp_path):
+    path = tmp_path / 'index.npz'
+    index = DedupIndex(path=path)
+    arrays = [np.eye(4, dtype=np.uint8), np.ones((4, 4), dtype=np.uint8)]
+    for array in arrays:
+        index.add(array)
+    index.save()
+
+    index = DedupIndex(path=path)
+    assert len(index) == 2
+    assert index.add(arrays[0]) == False
+    assert index.add(np.zeros((4, 4))) == True
+
+    with pytest.raises(ValueError):
+        DedupIndex(symmetric=True, path=path)
@@ -1,6 +1,8 @@
-from map_utils import Map
+from map_utils import Map, get_rng, carve_obstacles, generate_batch, label_components, map_seed, map_stats, free_degrees, dihedral_array, dihedral_nodes, obstacles_count, obstacles_percentage
 import numpy as np
+import pytest
 import sys
+import io
 
 
 def test_map():
@@ -110,6 +112,26 @@ def test_select_source_target():
         assert map.g.vs[source]['crossable'] == True
         assert map.g.vs[target]['crossable'] == True
 
+    map = Map.from_array(np.array([[0, 0, 1], [1, 1, 1], [0, 0, 0]]))
+    for _ in range(20):
+        assert map.select_source_target()[0] in (6, 7, 8)
+        source, target = map.select_source_target(source=7)
+        assert source == 7 and target in (6, 8)
+        source, target = map.select_source_target(target=0)
+        assert (source, target) == (1, 0)
+    assert map.select_source_target(6, 0) == (6, 0)
+    for source, target in [(2, None), (None, 9)]:
+        with pytest.raises(ValueError):
+            map.select_source_target(source, target)
+    nodes, starts, position = map.node_index()
+    assert nodes.tolist() == [0, 1, 6, 7, 8] and starts.tolist() == [0, 2, 5]
+    assert position.tolist() == [0, 1, -1, -1, -1, -1, 2, 3, 4]
+    map.array = np.array([[0, 1, 1], [0, 1, 1], [1, 1, 1]])
+    assert map.component_nodes().tolist() == [0, 3]
+    assert sorted(map.select_source_target()) == [0, 3]
+    with pytest.raises(ValueError):
+        Map.from_array(np.array([[0, 1], [1, 1]])).select_source_target(source=0)
+
 
 def test_select_sources_targets():
     map = Map(3, 3, 30)
@@ -122,3 +144,294 @@ def test_select_sources_targets():
     assert len(set(tuples)) == 10
 
 
+
+
+def test_carve_obstacles():
+    for width, height, perc in [(3, 3, 30), (8, 5, 40), (20, 20, 50), (4, 4, 0), (4, 4, 100)]:
+        array = carve_obstacles(width, height, perc)
+        assert array.shape == (height, width)
+        assert np.sum(array) == int(np.ceil(width * height * perc / 100))
+        free = np.flatnonzero(array.flatten() == 0)
+        if len(free) > 0:
+            g = Map(width, height, 0).g.induced_subgraph(free.tolist())
+            assert g.is_connected() == True
+
+    array = carve_obstacles(10, 10, 30, jump_perc=0, shuffle_edges=False)
+    assert np.sum(array) == 30
+
+
+def test_legacy_carving():
+    np.random.seed(42)
+    map = Map(5, 5, 40, legacy_carving=True)
+    assert map.array.tolist() == [[0, 0, 0, 0, 0], [1, 0, 0, 0, 1], [1, 0, 0, 0, 1], [1, 0, 1, 1, 1], [0, 0, 0, 1, 1]]
+
+    np.random.seed(7)
+    map = Map(6, 6, 30, jump_perc=60, shuffle_edges=False, legacy_carving=True)
+    assert map.array.tolist() == [[0, 1, 1, 1, 1, 1], [0, 1, 1, 1, 1, 0], [0, 0, 0, 1, 0, 0],
+                                  [0, 0, 1, 0, 0, 0], [0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0]]
+
+
+def test_rng():
+    np.random.seed(5)
+    expected = np.random.random(3)
+    np.random.seed(5)
+    assert np.array_equal(get_rng().random(3), expected)
+
+    state = np.random.get_state()
+    a = Map(8, 8, 30, rng=3)
+    b = Map(8, 8, 30, rng=np.random.default_rng(3))
+    assert np.array_equal(a.array, b.array)
+    assert a.select_sources_targets(5) == b.select_sources_targets(5)
+    assert a.select_sources_targets(5, stratify=True, rng=4) == b.select_sources_targets(5, stratify=True, rng=4)
+    assert np.array_equal(carve_obstacles(6, 6, 40, rng=5), carve_obstacles(6, 6, 40, rng=5))
+    assert np.array_equal(np.random.get_state()[1], state[1])
+
+    first = Map.from_seed(1, 8, 8, 30, 0)
+    again = Map.from_seed(1, 8, 8, 30, 0)
+    assert np.array_equal(first.array, again.array)
+    assert first.select_sources_targets(10) == again.select_sources_targets(10)
+    assert np.array_equal(map_seed(1, 8, 8, 30, 0).generate_state(4), map_seed(1, 8, 8, 30, 0).generate_state(4))
+    assert not np.array_equal(map_seed(1, 8, 8, 30, 0).generate_state(4), map_seed(1, 8, 8, 30, 1).generate_state(4))
+
+def test_lazy_graph():
+    map = Map.from_array(np.array([[0, 1, 0], [0, 0, 0], [1, 1, 0]]))
+    assert map._g is None
+    map.to_pddl((0, 8))
+    map.select_sources_targets(5)
+    assert map._g is None
+    assert map.g.vcount() == 9
+    assert map.g.vs['crossable'] == [True, False, True, True, True, True, False, False, True]
+
+    map.create_obstacles()
+    assert map.g.vs['crossable'] == (map.array.flatten() == 0).tolist()
+
+
+def test_to_pddl():
+    map = Map.from_array(np.array([[0, 0], [1, 0]]))
+    assert map.to_pddl((0, 3)) == ('(define (problem p01) (:domain map)\n\n'
+                                   '(:objects\n    c0 c1 c2 c3 - cell\n    a - agent\n)\n\n\n'
+                                   '(:init\n'
+                                   '    (is_left c0 c1)\n    (is_right c1 c0)\n'
+                                   '    (is_up c1 c3)\n    (is_down c3 c1)\n'
+                                   '    (in a c0)\n)\n\n\n'
+                                   '(:goal (and\n    (in a c3)\n))\n)')
+
+    f = io.StringIO()
+    map.write_pddl(f, (3, 1))
+    assert f.getvalue() == map.to_pddl((3, 1))
+
+    map.array = np.array([[0, 1], [1, 0]])
+    assert 'is_' not in map.to_pddl((0, 3))
+
+
+def test_generate_batch():
+    maps = generate_batch(50, 7, 5, 40, seed=1)
+    assert maps.shape == (50, 5, 7)
+    assert maps.dtype == np.uint8
+    assert (maps.reshape(50, -1).sum(axis=1) == 14).all()
+    grid = Map(7, 5, 0).g
+    for array in maps:
+        assert grid.induced_subgraph(np.flatnonzero(array.flatten() == 0).tolist()).is_connected() == True
+    assert len({array.tobytes() for array in maps}) > 1
+
+    assert np.array_equal(generate_batch(10, 6, 6, 30, seed=2, chunk_size=3), generate_batch(10, 6, 6, 30, seed=2, chunk_size=3))
+    assert (generate_batch(3, 4, 4, 100) == 1).all()
+    assert (generate_batch(3, 4, 4, 0, shuffle_edges=False) == 0).all()
+
+
+def test_select_sources_targets_sampling():
+    map = Map.from_array(np.array([[0, 0, 0], [1, 1, 0], [0, 0, 0]]))
+    tuples = map.select_sources_targets(100)
+    assert len(tuples) == 42
+    assert len(set(tuples)) == 42
+
+    tuples = map.select_sources_targets(30, min_distance=4)
+    assert set(tuples) == {(0, 8), (8, 0), (0, 7), (7, 0), (1, 6), (6, 1), (0, 6), (6, 0), (1, 7), (7, 1), (2, 6), (6, 2)}
+
+    tuples = map.select_sources_targets(50, unique=False)
+    assert len(tuples) == 50
+    for source, target in tuples:
+        assert source != target
+        assert map.array.flatten()[source] == 0
+        assert map.array.flatten()[target] == 0
+
+    map = Map(100, 100, 30)
+    tuples = map.select_sources_targets(20, min_distance=10)
+    assert len(set(tuples)) == 20
+    for source, target in tuples:
+        assert map.g.distances(source, target)[0][0] >= 10
+
+
+def test_distances():
+    map = Map.from_array(np.array([[0, 0, 0], [1, 1, 0], [0, 1, 0]]))
+    distances = map.distances([0, 8, 3])
+    assert distances.dtype == np.int16
+    assert distances.tolist() == [[0, 1, 2, -1, -1, 3, -1, -1, 4],
+                                  [4, 3, 2, -1, -1, 1, -1, -1, 0],
+                                  [-1] * 9]
+    assert map.distances().shape == (9, 9)
+    assert np.array_equal(map.distances([8]), map.distances([8]))
+
+    map.array = np.zeros((3, 3), dtype=np.uint8)
+    assert map.distances([0])[0, 8] == 4
+    assert map.to_pddl((0, 8), annotate=True).startswith('; optimal plan length: 4\n(define')
+
+
+def test_select_sources_targets_stratify():
+    map = Map(20, 20, 30)
+    tuples = map.select_sources_targets(40, stratify=True, min_distance=3)
+    assert len(set(tuples)) == 40
+    for source, target in tuples:
+        assert map.distances([source])[0, target] >= 3
+
+
+def test_components():
+    array = np.array([[0, 0, 1, 0], [1, 1, 1, 0], [0, 1, 0, 0], [0, 1, 1, 1]])
+    labels, n = label_components(array)
+    assert n == 3
+    assert labels.tolist() == [[0, 0, -1, 1], [-1, -1, -1, 1], [2, -1, 1, 1], [2, -1, -1, -1]]
+
+    map = Map.from_array(array)
+    assert map.is_connected() == False
+    assert map.n_components == 3
+    assert map.component_nodes().tolist() == [3, 7, 10, 11]
+    assert map.component_nodes(12).tolist() == [8, 12]
+    for source, target in map.select_sources_targets(20):
+        assert source in [3, 7, 10, 11] and target in [3, 7, 10, 11]
+
+    map = Map.from_array(array, repair=True)
+    assert map.is_connected() == True
+    assert map.array.tolist() == [[1, 1, 1, 0], [1, 1, 1, 0], [1, 1, 0, 0], [1, 1, 1, 1]]
+    assert map.obstacles_perc == 75
+
+    map = Map(10, 10, 40)
+    assert map.is_connected() == True
+    assert Map.from_array(np.ones((3, 3))).n_components == 0
+
+
+def test_stats():
+    array = np.array([[0, 0, 1, 0],
+                      [1, 0, 1, 0],
+                      [0, 0, 0, 0],
+                      [1, 1, 1, 0]])
+    assert free_degrees(array).tolist() == [[1, 2, 2, 1], [3, 2, 3, 2], [1, 3, 2, 3], [1, 1, 2, 1]]
+    stats = Map.from_array(array).stats()
+    assert stats == {'density': 6 / 16, 'free_cells': 10, 'components': 1, 'largest_component': 10,
+                     'dead_ends': 4, 'corridors': 4, 'junctions': 2, 'degree_histogram': [0, 4, 4, 2, 0]}
+
+    np.random.seed(0)
+    arrays = (np.random.rand(30, 5, 6) < 0.4).astype(np.uint8)
+    arrays[0] = 1
+    batch = map_stats(arrays)
+    assert batch['degree_histogram'].shape == (30, 5)
+    for i, array in enumerate(arrays):
+        labels, n = label_components(array)
+        assert batch['components'][i] == n
+        assert batch['largest_component'][i] == (np.bincount(labels[labels >= 0]).max() if n > 0 else 0)
+        assert batch['free_cells'][i] == np.sum(array == 0)
+        assert batch['degree_histogram'][i].tolist() == np.bincount(free_degrees(array)[array == 0], minlength=5).tolist()
+
+
+def test_variants():
+    map = Map.from_seed(0, 7, 5, 30, 0)
+    source, target = map.select_source_target()
+    pddl = map.to_pddl((source, target), annotate=True)
+    rows, cols = divmod(np.array([source, target]), 7)
+    variants = list(map.variants())
+    assert np.array_equal(variants[0].array, map.array)
+    assert [v.array.shape for v in variants] == [(5, 7), (7, 5)] * 4
+    assert len({v.array.tobytes() + bytes(v.array.shape) for v in variants}) == 8
+    for k, variant in enumerate(variants):
+        assert variant.obstacles_perc == map.obstacles_perc
+        assert np.array_equal(variant.array, dihedral_array(map.array, k))
+        pair = map.variant_nodes((source, target), k)
+        # The remapped nodes are the same cells of the variant.
+        marked = np.zeros_like(map.array)
+        marked[rows, cols] = [1, 2]
+        marked = dihedral_array(marked, k).flatten()
+        assert pair == (int(np.argmax(marked == 1)), int(np.argmax(marked == 2)))
+        variant_pddl = variant.to_pddl(pair, annotate=True)
+        assert variant_pddl.splitlines()[0] == pddl.splitlines()[0]
+        assert variant_pddl == Map.from_array(variant.array.copy()).to_pddl(pair, annotate=True)
+    nodes = np.arange(35)
+    for k in range(8):
+        assert np.array_equal(dihedral_nodes(nodes, 7, 5, k), dihedral_array(nodes.reshape(5, 7), k).flatten().argsort())
+    with pytest.raises(ValueError):
+        map.variant(8)
+
+
+def test_obstacles_percentage():
+    # 2 obstacles in 256 cells is 0%, which check_values used to reject.
+    array = np.zeros((16, 16), dtype=np.uint8)
+    array[0, :2] = 1
+    assert Map.from_array(array).obstacles_perc == 0
+    assert obstacles_count(4, 4, 30) == 5
+    assert obstacles_percentage(5, 4, 4) == 31
+    Map(4, 4, 30, Map(4, 4, 30).array)
+    Map(4, 4, 31, Map(4, 4, 30).array)
+    with pytest.raises(ValueError):
+        Map(4, 4, 32, Map(4, 4, 30).array)
+
+
+def test_edit():
+    # A wall with a door: closing it splits the map, opening it joins it again.
+    array = np.zeros((5, 7), dtype=np.uint8)
+    array[:, 3] = 1
+    map = Map.from_array(array.copy())
+    map.node_index()
+    map.g
+    map.clear_obstacle(2 * 7 + 3)
+    assert map.is_connected()
+    assert map.obstacles_perc == obstacles_percentage(4, 7, 5)
+    assert map.g.vs[2 * 7 + 3]['crossable']
+    map.set_obstacle(2 * 7 + 3)
+    assert map.n_components == 2
+    assert not map.g.vs[2 * 7 + 3]['crossable']
+    assert np.array_equal(map.array, array)
+    map.clear_obstacles(array == 1)
+    assert map.obstacles_perc == 0 and map.n_components == 1
+    map.set_obstacles(np.flatnonzero(array))
+    assert map.n_components == 2
+    with pytest.raises(ValueError):
+        map.set_obstacles(np.zeros((7, 5), dtype=bool))
+
+    # A read-only array, as given by MapSet, is copied before the first edit.
+    array.flags.writeable = False
+    map = Map.from_array(array)
+    map.clear_obstacle(3)
+    assert array[0, 3] == 1 and map.array[0, 3] == 0
+
+    # Random edits keep the caches equal to the ones of a new map.
+    rng = np.random.default_rng(0)
+    for trial in range(20):
+        map = Map.from_seed(trial, 9, 6, 40, 0)
+        map.node_index()
+        for step in range(30):
+            node = int(rng.integers(54))
+            map.set_obstacle(node) if rng.random() < 0.5 else map.clear_obstacle(node)
+            fresh = Map.from_array(map.array.copy())
+            assert map.n_components == fresh.n_components
+            assert np.array_equal(map.components, fresh.components)
+            for a, b in zip(map.node_index(), fresh.node_index()):
+                assert np.array_equal(a, b)
+            map.check_values()
+
+
+def _assert_same_walk(arrays, legacy):
+    # The means of the statistics must agree within 4 standard errors.
+    stats, legacy_stats = map_stats(arrays), map_stats(legacy)
+    for name in ('corridors', 'dead_ends', 'junctions'):
+        a, b = stats[name], legacy_stats[name]
+        error = np.sqrt(a.var() / len(a) + b.var() / len(b))
+        assert abs(a.mean() - b.mean()) < 4 * error, name
+
+
+def test_fast_walk_distribution():
+    legacy = np.stack([carve_obstacles(16, 16, 20, 50, legacy=True, rng=np.random.default_rng([0, i])) for i in range(100)])
+    fast = np.stack([carve_obstacles(16, 16, 20, 50, rng=np.random.default_rng([1, i])) for i in range(100)])
+    _assert_same_walk(fast, legacy)
+
+
+def test_generate_batch_distribution():
+    legacy = np.stack([carve_obstacles(16, 16, 20, 50, legacy=True, rng=np.random.default_rng([0, i])) for i in range(100)])
+    _assert_same_walk(generate_batch(100, 16, 16, 20, 50, seed=0), legacy)
@@ -0,0 +1,83 @@
+from map_utils import Map, MapsWriter, MapSet, save_map_set, convert_json_maps, dihedral_array, generate_batch
+import numpy as np
+import pytest
+import tracemalloc
+
+
+def test_map_set(tmp_path):
+    arrays = np.stack([Map(5, 4, 30).array for _ in range(6)])
+    problems = [(2 * i + k, i, 0, i + k) for i in range(6) for k in range(2)]
+    for packed in [False, True]:
+        path = tmp_path / f'set_{packed}'
+        save_map_set(path, arrays, problems, packed=packed)
+        map_set = MapSet(path)
+        assert len(map_set) == 6
+        for i, map in enumerate(map_set):
+            assert map.width == 5
+            assert map.height == 4
+            assert np.array_equal(map.array, arrays[i])
+        assert map_set.map_problems(3).tolist() == [(6, 3, 0, 3), (7, 3, 0, 4)]
+
+    map_set = MapSet(tmp_path / 'set_False')
+    assert np.shares_memory(map_set.array(2), map_set.grids)
+
+
+def test_convert_json_maps(tmp_path):
+    arrays = [Map(4, 4, 20).array for _ in range(3)]
+    for compact in [False, True]:
+        json_file = tmp_path / f'maps_{compact}.json'
+        with MapsWriter(json_file, compact=compact) as writer:
+            for i, array in enumerate(arrays):
+                writer.write_map(f'm{i :06d}', array, [(f'p{10 + 2 * i :06d}', 1, 2), (f'p{11 + 2 * i :06d}', 2, 1)])
+        convert_json_maps(json_file, tmp_path / f'set_{compact}')
+        map_set = MapSet(tmp_path / f'set_{compact}')
+        assert len(map_set) == 3
+        assert np.array_equal(map_set.array(1), arrays[1])
+        assert map_set.map_problems(2).tolist() == [(14, 2, 1, 2), (15, 2, 2, 1)]
+
+
+def test_variants(tmp_path):
+    arrays = np.stack([Map(5, 4, 30).array for _ in range(3)])
+    problems = [(i, i, 0, 3 + i) for i in range(3)]
+    save_map_set(tmp_path / 'set', arrays, problems)
+    variants = MapSet(tmp_path / 'set').variants()
+    assert len(variants) == 24
+    assert np.shares_memory(variants[13], variants.grids)
+    assert np.array_equal(variants[13], dihedral_array(arrays[1], 5))
+    assert variants.map(13).width == 4
+    batch = variants.batch(3)
+    assert batch.shape == (3, 5, 4)
+    assert np.array_equal(batch[2], variants[2 * 8 + 3])
+    table = variants.batch_problems(3)
+    for i in range(3):
+        map = Map.from_array(arrays[i])
+        assert (table['source'][i], table['target'][i]) == map.variant_nodes((0, 3 + i), 3)
+    assert np.array_equal(variants.problems['target'], [3, 4, 5])
+
+    save_map_set(tmp_path / 'packed', arrays, problems, packed=True)
+    with pytest.raises(ValueError):
+        MapSet(tmp_path / 'packed').variants()
+
+
+def test_convert_json_maps_streaming(tmp_path):
+    arrays = generate_batch(100, 32, 32, 30, seed=0)
+    json_file = tmp_path / 'maps.json'
+    with MapsWriter(json_file) as writer:
+        for i, array in enumerate(arrays):
+            writer.write_map(f'm{i :06d}', array, [(f'p{2 * i :06d}', 1, 2), (f'p{2 * i + 1 :06d}', 3, 4)])
+    for packed in [False, True]:
+        tracemalloc.start()
+        convert_json_maps(json_file, tmp_path / f'set_{packed}', packed=packed)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Only a few maps are in memory at once, not the 100 KiB of grids.
+        assert peak < arrays.nbytes
+        map_set = MapSet(tmp_path / f'set_{packed}')
+        assert len(map_set) == 100
+        assert np.array_equal(map_set.array(71), arrays[71])
+        assert map_set.map_problems(99).tolist() == [(198, 99, 1, 2), (199, 99, 3, 4)]
+
+    with open(json_file, 'a') as f:
+        f.write('{"problem": "p000200", "map_id": "m000023", "source_destination": [1, 2]}\n')
+    with pytest.raises(ValueError):
+        convert_json_maps(json_file, tmp_path / 'broken')
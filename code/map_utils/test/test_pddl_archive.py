@@ -0,0 +1,69 @@
+from map_utils import Map, PDDLArchive, PDDLArchiveWriter, compress_problems
+import pytest
+import tarfile
+import zipfile
+import numpy as np
+
+
+@pytest.mark.parametrize('format', ['zip', 'tar.gz'])
+def test_pddl_archive(tmp_path, format):
+    map = Map(6, 5, 30)
+    pairs = map.select_sources_targets(7)
+    with PDDLArchiveWriter(tmp_path, 'problems_6x6_30', shard_size=3, format=format) as writer:
+        for i, pair in enumerate(pairs):
+            writer.add(f'p{i :06d}', map.to_pddl(pair))
+    assert writer.shards == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['problems_6x6_30.index.jsonl'] + [f'problems_6x6_30_{i :04d}.{format}' for i in range(3)]
+
+    archive = PDDLArchive(tmp_path)
+    assert len(archive) == 7
+    assert 'p000006' in archive and 'p000007' not in archive
+    for i in np.random.permutation(7):
+        assert archive.read(f'p{i :06d}') == map.to_pddl(pairs[i])
+    archive.extract('p000004', tmp_path / 'p000004.pddl')
+    assert (tmp_path / 'p000004.pddl').read_text() == map.to_pddl(pairs[4])
+
+
+@pytest.mark.parametrize('format', ['zip', 'tar.gz'])
+def test_pddl_archive_compressed(tmp_path, format):
+    map = Map(8, 8, 30)
+    texts = [(f'p{i :06d}', map.to_pddl(pair)) for i, pair in enumerate(map.select_sources_targets(10))]
+    with PDDLArchiveWriter(tmp_path, 'problems', shard_size=4, format=format, compresslevel=1) as writer:
+        for i in range(0, 10, 3):
+            writer.add_compressed(*compress_problems(texts[i:i + 3], format, 1))
+    # The blocks are not split: the shards hold 6 and 4 problems.
+    assert writer.shards == 2
+    archive = PDDLArchive(tmp_path)
+    assert [archive.read(name) for name, _ in texts] == [text for _, text in texts]
+    names = []
+    for shard in range(2):
+        path = tmp_path / f'problems_{shard :04d}.{format}'
+        if format == 'zip':
+            with zipfile.ZipFile(path) as f:
+                assert f.testzip() is None
+                names.append(f.namelist())
+        else:
+            with tarfile.open(path) as f:
+                names.append(f.getnames())
+    assert names == [[f'{name}.pddl' for name, _ in texts[:6]], [f'{name}.pddl' for name, _ in texts[6:]]]
+
+
+def test_pddl_archive_format():
+    with pytest.raises(ValueError):
+        PDDLArchiveWriter('.', 'problems', format='rar')
+    with pytest.raises(ValueError):
+        PDDLArchiveWriter('.', 'problems', shard_size=70000, format='zip')
+
+
+@pytest.mark.parametrize('format', ['zip', 'tar.gz'])
+def test_pddl_archive_deterministic(tmp_path, monkeypatch, format):
+    map = Map(6, 5, 30)
+    texts = [map.to_pddl(pair) for pair in map.select_sources_targets(4)]
+    for run, now in enumerate([1e9, 2e9]):
+        monkeypatch.setattr('time.time', lambda: now)
+        with PDDLArchiveWriter(tmp_path / str(run), 'problems', format=format) as writer:
+            for i, text in enumerate(texts):
+                writer.add(f'p{i :06d}', text)
+    for name in [f'problems_0000.{format}', 'problems.index.jsonl']:
+        assert (tmp_path / '0' / name).read_bytes() == (tmp_path / '1' / name).read_bytes()
+    assert PDDLArchive(tmp_path / '1').read('p000003') == texts[3]
@@ -0,0 +1,49 @@
+from map_utils import Map, map_codes, tile_maps, save_tiles, save_thumbnails, plot_tiles
+import matplotlib
+import numpy as np
+
+
+def test_tile_maps():
+    maps = np.array([[[0, 1], [0, 0]], [[1, 0], [0, 0]], [[0, 0], [0, 1]]], dtype=np.uint8)
+    codes = map_codes(maps, [(0, 3), None, (1, 2)])
+    assert codes.tolist() == [[[2, 1], [0, 3]], [[1, 0], [0, 0]], [[0, 2], [3, 1]]]
+
+    image = tile_maps(maps, columns=2, scale=2)
+    assert image.shape == (2 * 5 + 1, 2 * 5 + 1, 3)
+    assert image.dtype == np.uint8
+    assert image[0].tolist() == [[128, 128, 128]] * 11
+    assert image[1, 1].tolist() == [255, 255, 255]
+    assert image[1, 3].tolist() == [0, 0, 0]
+    assert image[7:10, 7:10].tolist() == [[[128, 128, 128]] * 3] * 3
+
+    codes = map_codes([np.zeros((2, 3)), np.ones((3, 2))], [(5, 0), (0, 5)])
+    assert codes.shape == (2, 3, 3)
+    assert codes[0].tolist() == [[3, 0, 0], [0, 0, 2], [4, 4, 4]]
+    assert codes[1].tolist() == [[2, 1, 4], [1, 1, 4], [1, 3, 4]]
+
+
+def test_save_images(tmp_path):
+    matplotlib.use('Agg')
+    maps = [Map(6, 5, 30) for _ in range(5)]
+    arrays = np.stack([map.array for map in maps])
+    pairs = [map.select_sources_targets(1)[0] for map in maps]
+
+    save_tiles(arrays, tmp_path / 'tiles.png', pairs, scale=3)
+    assert matplotlib.image.imread(tmp_path / 'tiles.png').shape[:2] == (2 * 16 + 1, 3 * 19 + 1)
+
+    paths = save_thumbnails(arrays, tmp_path / 'thumbnails', [f'm{i}' for i in range(5)], pairs, scale=2)
+    assert len(paths) == 5
+    thumbnail = matplotlib.image.imread(paths[1])
+    assert thumbnail.shape[:2] == (10, 12)
+    assert np.array_equal((thumbnail[::2, ::2, 0] * 255).round(), tile_maps(arrays[1:2], pairs[1:2], padding=0)[:, :, 0])
+
+    plot_tiles(arrays, pairs, tmp_path / 'plot.png', show=False)
+    assert (tmp_path / 'plot.png').exists()
+
+
+def test_star_import():
+    namespace = {}
+    exec('from map_utils import *', namespace)
+    assert {'plot_maps', 'plot_map', 'save_tiles', 'Map', 'MapSet', 'DedupIndex', 'PDDLArchive', 'format_map_id'} <= set(namespace)
+    # The modules the submodules import stay out of the caller's namespace.
+    assert not {'json', 'os', 'np', 'deque', 'zlib', 'Union', 'map', 'dataset'} & set(namespace)
@@ -0,0 +1,111 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Union
+
+
+class Metrics:
+    """
+    Counters and timers of a run. Metrics collected in worker processes are
+    sent back with to_dict and added to the ones of the main process with merge.
+
+    Attributes:
+        counters (Dict[str, int]): The value of each counter.
+        timers (Dict[str, float]): The seconds spent in each timer.
+    """
+
+    def __init__(self) -> None:
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+
+
+    def count(self, name: str, n: int = 1) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The name of the counter.
+            n (int, optional): The increment. Defaults to 1.
+        """
+        self.counters[name] += n
+
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Adds the time spent in the with block to a timer.
+
+        Args:
+            name (str): The name of the timer.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - start
+
+
+    def merge(self, other: Union['Metrics', Dict[str, Dict[str, float]]]) -> None:
+        """
+        Adds the counters and timers of other to these.
+
+        Args:
+            other (Union[Metrics, Dict[str, Dict[str, float]]]): A Metrics object or
+                the output of its to_dict.
+        """
+        other = other.to_dict() if isinstance(other, Metrics) else other
+        for name, value in other['counters'].items():
+            self.counters[name] += value
+        for name, value in other['timers'].items():
+            self.timers[name] += value
+
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns:
+            Dict[str, Dict[str, float]]: The counters and the timers.
+        """
+        return {'counters': dict(self.counters), 'timers': dict(self.timers)}
+
+
+class ProgressLogger:
+    """
+    Prints the throughput of a run at most once every interval seconds.
+
+    Attributes:
+        interval (float): The minimum number of seconds between two lines.
+        start (float): The time the run started.
+    """
+
+    def __init__(self, interval: float = 30.0) -> None:
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.last = self.start
+
+
+    def elapsed(self) -> float:
+        """
+        Returns:
+            float: The seconds since the run started.
+        """
+        return time.perf_counter() - self.start
+
+
+    def log(self, message: str, force: bool = False, **counts: int) -> None:
+        """
+        Prints the message with the rate per second of each count, if interval
+        seconds passed since the last line or force is True.
+
+        Args:
+            message (str): The prefix of the line.
+            force (bool, optional): Whether to print regardless of the interval.
+                                    Defaults to False.
+            **counts (int): The totals to report, with their rate.
+        """
+        now = time.perf_counter()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        elapsed = max(now - self.start, 1e-9)
+        rates = ', '.join(f'{value} {name} ({value / elapsed:.1f} {name}/s)' for name, value in counts.items())
+        print(f'[{elapsed:8.1f}s] {message}: {rates}', flush=True)
@@ -0,0 +1,28 @@
+from benchmarks.bench_map import run_benchmarks, compare_results
+from benchmarks.bench_import import measure_import, check_budget
+
+
+def test_run_benchmarks():
+    results = run_benchmarks([8], [30], [25], repeat=1, verbose=False)
+    assert list(results) == ['size=8,obstacles_perc=30,jump_perc=25']
+    assert set(results['size=8,obstacles_perc=30,jump_perc=25']) == {'init', 'create_obstacles', 'from_array', 'to_pddl', 'select_sources_targets'}
+    assert compare_results(results, results) == []
+
+
+def test_compare_results():
+    baseline = {'a': {'init': {'time': 0.010, 'peak_kib': 100.0}, 'to_pddl': {'time': 0.0001, 'peak_kib': 10.0}}}
+    results = {'a': {'init': {'time': 0.011, 'peak_kib': 100.0}, 'to_pddl': {'time': 0.001, 'peak_kib': 10.0}},
+               'b': {'init': {'time': 1.0, 'peak_kib': 1.0}}}
+    assert compare_results(results, baseline) == []
+
+    results['a']['init'] = {'time': 0.013, 'peak_kib': 200.0}
+    assert len(compare_results(results, baseline)) == 2
+    assert compare_results(results, baseline, threshold=1.5) == []
+
+
+def test_import_budget():
+    result = measure_import(repeat=1)
+    assert check_budget(result) == []
+    assert 'numpy' in result['modules']
+    assert check_budget(result, budget=0.0) != []
+    assert check_budget(measure_import('import map_utils; map_utils.plot_map', repeat=1)) == ['imported matplotlib']
@@ -0,0 +1,113 @@
+from create_dataset import BucketSpec, BucketGenerator, read_bucket_specs, parse_stats_filter, parse_stratify, accept_stats, estimate_bucket, read_config, read_seed
+from map_utils import DedupIndex
+from multiprocessing import Pool
+import configparser
+import os
+import numpy as np
+import pytest
+
+
+def test_read_bucket_specs():
+    config = configparser.ConfigParser()
+    config.read_string('''
+[EXPERIMENTAL_SETTINGS]
+rows = 6,8
+obstacle_percs = 10,30
+num_maps = 5
+num_paths = 20
+num_paths.8x8 = 10
+num_paths.8x8_30 = 3
+jump_perc.30% = 80
+min_distance =
+shuffle_edges.6x6_10 = False
+''')
+    specs = read_bucket_specs(config['EXPERIMENTAL_SETTINGS'])
+    assert [spec.key for spec in specs] == ['6x6_10', '6x6_30', '8x8_10', '8x8_30']
+    assert [spec.num_paths for spec in specs] == [20, 20, 10, 3]
+    assert [spec.jump_perc for spec in specs] == [25, 80, 25, 80]
+    assert [spec.shuffle_edges for spec in specs] == [False, True, True, True]
+    assert all(spec.num_maps == 5 and spec.min_distance is None for spec in specs)
+
+
+def test_stats_filter():
+    conditions = parse_stats_filter('dead_ends >= 2, density<0.4')
+    assert conditions == [('dead_ends', '>=', 2.0), ('density', '<', 0.4)]
+    assert accept_stats({'dead_ends': 2, 'density': 0.3}, conditions)
+    assert not accept_stats({'dead_ends': 1, 'density': 0.3}, conditions)
+    assert parse_stats_filter('') == []
+    with pytest.raises(ValueError):
+        parse_stats_filter('dead_ends ~ 2')
+    for line in ['dead_end >= 2', 'degree_histogram > 1']:
+        with pytest.raises(ValueError):
+            parse_stats_filter(line)
+
+
+def test_parse_stratify():
+    assert parse_stratify('', '0,5') is None
+    assert parse_stratify('dead_ends', '0, 5, 10') == ('dead_ends', [0.0, 5.0, 10.0])
+    for stat, bins in [('dead_end', '0,5'), ('degree_histogram', '0,5'), ('dead_ends', '5'), ('dead_ends', ''), ('dead_ends', '5,0')]:
+        with pytest.raises(ValueError):
+            parse_stratify(stat, bins)
+
+
+def test_bucket_generator_workers():
+    def run(pool, num_workers, sizes):
+        generator = BucketGenerator(BucketSpec(4, 30, 40, num_paths=3), 0, max_rejects=20, stats_filter=[('dead_ends', '>=', 1.0)],
+                                    stratify=('corridors', [0, 2, 4, 100], 10), pool=pool, num_workers=num_workers)
+        maps = [m for size in sizes for m in generator.generate(size)]
+        return maps, generator.next_seed, generator.strata, generator.exhausted
+
+    serial = run(None, 1, [40])
+    assert serial[3] and 0 < len(serial[0]) < 40
+
+    # A new generator, built from what the checkpoint keeps, continues the bucket.
+    first = run(None, 1, [7])
+    index = DedupIndex()
+    for _, array, _ in first[0]:
+        index.add(array)
+    generator = BucketGenerator(BucketSpec(4, 30, 40, num_paths=3), 0, index, 20, first[1], [('dead_ends', '>=', 1.0)],
+                                ('corridors', [0, 2, 4, 100], 10), first[2])
+    rest = list(generator.generate(33))
+    assert [i for i, _, _ in first[0] + rest] == [i for i, _, _ in serial[0]]
+    assert (generator.next_seed, generator.strata, generator.exhausted) == serial[1:]
+    with Pool(3) as pool:
+        for result in [run(pool, 3, [40]), run(None, 1, [7, 5, 28]), run(pool, 3, [1, 39])]:
+            assert [(i, pairs) for i, _, pairs in result[0]] == [(i, pairs) for i, _, pairs in serial[0]]
+            assert all(np.array_equal(a, b) for (_, a, _), (_, b, _) in zip(result[0], serial[0]))
+            assert result[1:] == serial[1:]
+
+
+def test_estimate_bucket():
+    spec = BucketSpec(6, 30, 50, num_paths=4)
+    for pddl_format, files in [('files', 200 + 2), ('zip', 2 + 1 + 2)]:
+        estimate = estimate_bucket(spec, 50, 0, 5, pddl_format=pddl_format, pddl_shard_size=100)
+        assert estimate['sampled_maps'] == 5
+        assert estimate['problems'] == 200
+        assert estimate['files'] == files
+        assert estimate['pddl_bytes'] > 0 and estimate['json_bytes'] > 0
+        assert 0 < estimate['serial_seconds'] < estimate['seconds']
+
+    # A map without obstacles has a single variant: the bucket stops after it.
+    estimate = estimate_bucket(BucketSpec(4, 0, 30, num_paths=5), 30, 0, 5)
+    assert estimate['exhausted']
+    assert (estimate['maps'], estimate['problems'], estimate['files']) == (1, 5, 5 + 2)
+
+
+def test_read_config_template():
+    config = read_config(os.path.join(os.path.dirname(__file__), '..', 'create_dataset_template.ini'))
+    for tag in ['EXPERIMENTAL_SETTINGS', 'DEBUG_SETTINGS']:
+        section = config[tag]
+        specs = read_bucket_specs(section)
+        assert all(spec.min_distance is None for spec in specs)
+        assert parse_stats_filter(section.get('stats_filter')) == []
+        assert section.get('stratify_stat') == ''
+        assert section.getint('num_workers') == 1 and section.getint('checkpoint_maps') == 1000
+
+
+def test_read_seed():
+    config = read_config(os.path.join(os.path.dirname(__file__), '..', 'create_dataset_template.ini'))
+    assert read_seed(config['EXPERIMENTAL_SETTINGS']) == 0
+    config.read_string('[EXPERIMENTAL_SETTINGS]\nseed = # random\n[DEBUG_SETTINGS]\n')
+    assert read_seed(config['EXPERIMENTAL_SETTINGS']) is None
+    assert read_seed(config['DEBUG_SETTINGS']) == 0
+    assert read_seed(config['DEFAULT']) is None
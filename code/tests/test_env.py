@@ -0,0 +1,49 @@
+from env import navigation_env, batch_navigation_env
+from map_utils import MapsWriter, layout_batches
+import numpy as np
+
+
+def test_batch_navigation_env():
+    block = [[0, 0, 1], [1, 0, 1], [0, 0, 0]]
+    env = batch_navigation_env(3)
+    env.load_layouts([(block, (0, 0), (2, 2)), (block, (2, 0), (2, 1)), (block, (1, 1), (1, 1))])
+    assert env.blocks.shape == (3, 3, 3)
+    assert env.done.tolist() == [False, False, True]
+
+    done, valid = env.step([3, 3, 1])
+    assert env.cur_pos.tolist() == [[0, 1], [2, 1], [1, 1]]
+    assert done.tolist() == [False, True, True]
+    assert valid.tolist() == [True, True, True]
+
+    done, valid = env.step([3, 0, 0])
+    assert env.cur_pos.tolist() == [[0, 1], [2, 1], [1, 1]]
+    assert valid.tolist() == [False, True, True]
+
+    for action in [1, 1, 3]:
+        done, valid = env.step([action, 0, 0])
+    assert env.cur_pos.tolist() == [[2, 2], [2, 1], [1, 1]]
+    assert done.tolist() == [True, True, True]
+
+    env.reset_game(np.array([True, False, False]))
+    assert env.cur_pos.tolist() == [[0, 0], [2, 1], [1, 1]]
+    assert env.done.tolist() == [False, True, True]
+    env.reset_game()
+    assert env.cur_pos.tolist() == [[0, 0], [2, 0], [1, 1]]
+
+
+def test_load_layout_batches(tmp_path):
+    array = np.array([[0, 0, 1], [1, 0, 1], [0, 0, 0]])
+    with MapsWriter(tmp_path / 'maps.json') as writer:
+        writer.write_map('m000000', array, [('p000000', 0, 8), ('p000001', 6, 4)])
+    blocks, start_pos, goal_pos = next(layout_batches([tmp_path / 'maps.json'], 2))
+
+    env = navigation_env(3)
+    env.load_layout((blocks[1], start_pos[1], goal_pos[1]))
+    assert env.cur_pos == (2, 0)
+    assert env.goal_pos == (1, 1)
+
+    env = batch_navigation_env(3)
+    env.load_arrays(blocks, start_pos, goal_pos)
+    assert env.cur_pos.tolist() == [[0, 0], [2, 0]]
+    done, _ = env.step([1, 3])
+    assert env.cur_pos.tolist() == [[0, 0], [2, 1]]
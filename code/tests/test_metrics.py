@@ -0,0 +1,26 @@
+from project_utils.metrics import Metrics, ProgressLogger
+
+
+def test_metrics():
+    metrics = Metrics()
+    metrics.count('maps')
+    metrics.count('problems', 20)
+    with metrics.timer('pddl_write'):
+        pass
+    other = Metrics()
+    other.count('maps', 2)
+    other.count('dedup_rejects')
+    metrics.merge(other)
+    metrics.merge(other.to_dict())
+    assert metrics.counters == {'maps': 5, 'problems': 20, 'dedup_rejects': 2}
+    assert metrics.timers['pddl_write'] >= 0
+
+
+def test_progress_logger(capsys):
+    progress = ProgressLogger(interval=3600)
+    progress.log('Dataset', maps=1)
+    assert capsys.readouterr().out == ''
+    progress.log('Dataset', force=True, maps=1, problems=20)
+    out = capsys.readouterr().out
+    assert 'Dataset: 1 maps' in out
+    assert '20 problems' in out